@@ -1,7 +1,6 @@
 def compute_line_and_column(text, i):
-    lines = text[:i].split('\n')
-    lineno = len(lines)
-    charno = i + 1 - sum(len(l) + 1 for l in lines[:-1])
+    lineno = text.count('\n', 0, i) + 1
+    charno = i - text.rfind('\n', 0, i)
     return lineno, charno
 
 
@@ -20,11 +19,9 @@ class ParseError(WslValueError):
         assert isinstance(errorpos, int)
         assert isinstance(errormsg, str)
 
-        startline, startcolumn = compute_line_and_column(text, startpos)
-        errorline, errorcolumn = compute_line_and_column(text, errorpos)
-        message = 'While parsing %s (starting at line %d char %d): At line %d char %d: %s' %(context, startline, startcolumn, errorline, errorcolumn, errormsg)
-
-        super().__init__(message)
+        # The message is only formatted when the error is printed. Errors
+        # that are caught and recovered from don't pay for line counting.
+        super().__init__()
 
         self.context = context
         self.text = text
@@ -32,6 +29,23 @@ class ParseError(WslValueError):
         self.errorpos = errorpos
         self.errormsg = errormsg
 
+    def __str__(self):
+        startline, startcolumn = compute_line_and_column(self.text, self.startpos)
+        errorline, errorcolumn = compute_line_and_column(self.text, self.errorpos)
+        return 'While parsing %s (starting at line %d char %d): At line %d char %d: %s' %(self.context, startline, startcolumn, errorline, errorcolumn, self.errormsg)
+
+    # args is the formatted message, and pickling goes through the
+    # constructor arguments instead
+    @property
+    def args(self):
+        return (str(self),)
+
+    def __repr__(self):
+        return '%s(%r)' %(type(self).__name__, str(self))
+
+    def __reduce__(self):
+        return (type(self), (self.context, self.text, self.startpos, self.errorpos, self.errormsg))
+
 
 class LexError(WslValueError):
     """LexError represents WSL text format token lexing errors
@@ -52,12 +66,8 @@ class LexError(WslValueError):
         assert isinstance(errorpos, int)
         assert isinstance(errormsg, str)
 
-        startline, startcolumn = compute_line_and_column(text, startpos)
-        errorline, errorcolumn = compute_line_and_column(text, errorpos)
-
-        message = 'While lexing %s (starting at line %d char %d): At line %d char %d: %s' %(lexicaltype, startline, startcolumn, errorline, errorcolumn, errormsg)
-
-        super().__init__(message + '\nThe whole input: \n' + text + '\n')
+        # formatted lazily, like ParseError
+        super().__init__()
 
         self.lexicaltype = lexicaltype
         self.text = text
@@ -65,6 +75,22 @@ class LexError(WslValueError):
         self.errorpos = errorpos
         self.errormsg = errormsg
 
+    def __str__(self):
+        startline, startcolumn = compute_line_and_column(self.text, self.startpos)
+        errorline, errorcolumn = compute_line_and_column(self.text, self.errorpos)
+        message = 'While lexing %s (starting at line %d char %d): At line %d char %d: %s' %(self.lexicaltype, startline, startcolumn, errorline, errorcolumn, self.errormsg)
+        return message + '\nThe whole input: \n' + self.text + '\n'
+
+    @property
+    def args(self):
+        return (str(self),)
+
+    def __repr__(self):
+        return '%s(%r)' %(type(self).__name__, str(self))
+
+    def __reduce__(self):
+        return (type(self), (self.lexicaltype, self.text, self.startpos, self.errorpos, self.errormsg))
+
 
 class FormatError(WslValueError):
     """Raised on database formatting errors"""
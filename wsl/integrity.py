@@ -1,6 +1,19 @@
+import operator
+
 import wsl
 
 
+def _make_key_getter(cols):
+    """Make a function that extracts the columns *cols* from a row, as a tuple"""
+    if len(cols) == 0:
+        return lambda row: ()
+    elif len(cols) == 1:
+        c, = cols
+        return lambda row: (row[c],)
+    else:
+        return operator.itemgetter(*cols)
+
+
 def check_database_integrity(schema, tables):
     """Check integrity of a database.
 
@@ -17,8 +30,8 @@ def check_database_integrity(schema, tables):
     assert isinstance(tables, dict)
 
     idx_of = {}  # key name -> key columns (in sorted order) -> row
-    keys_of = {}  # table name -> list of (SchemaKey, columns indices, idx)
-    fkeys_of = {}  # table name -> list of (SchemaForeignKey, columns indices, idx)
+    keys_of = {}  # table name -> list of (SchemaKey, columns getter, idx)
+    fkeys_of = {}  # table name -> list of (SchemaForeignKey, columns getter, idx)
 
     for table in schema.tables:
         keys_of[table] = []
@@ -27,7 +40,7 @@ def check_database_integrity(schema, tables):
     for schemakey in schema.keys.values():
         idx = {}
         idx_of[schemakey.name] = idx
-        keys_of[schemakey.table].append((schemakey, schemakey.columns, idx))
+        keys_of[schemakey.table].append((schemakey, _make_key_getter(schemakey.columns), idx))
 
     for schemafkey in schema.foreignkeys.values():
         zkey = sorted(zip(schemafkey.refcolumns, schemafkey.columns))
@@ -35,10 +48,10 @@ def check_database_integrity(schema, tables):
         remote = tuple(x for x, y in zkey)
 
         found = False
-        for candidate_schemakey, candidate_remote, candidate_idx in keys_of[schemafkey.reftable]:
-            if remote == candidate_remote:
+        for candidate_schemakey, _, candidate_idx in keys_of[schemafkey.reftable]:
+            if remote == candidate_schemakey.columns:
                 assert found == False
-                fkeys_of[schemafkey.table].append((schemafkey, local, candidate_idx))
+                fkeys_of[schemafkey.table].append((schemafkey, _make_key_getter(local), candidate_idx))
                 found = True
 
         # XXX: This check should be more "static", i.e. at Schema construction
@@ -49,15 +62,15 @@ def check_database_integrity(schema, tables):
     for table, rows in tables.items():
         tablekeys = keys_of[table]
         for row in rows:
-            for schemakey, cols, idx in tablekeys:
-                rowkey = tuple(row[c] for c in cols)
+            for schemakey, get_key, idx in tablekeys:
+                rowkey = get_key(row)
                 if idx.setdefault(rowkey, row) is not row:
                     raise wsl.IntegrityError('Table "%s" has row "%s" which violates key "%s"' %(schemakey.table, row, schemakey.name))
 
     for table, rows in sorted(tables.items()):
         tablefkeys = fkeys_of[table]
         for row in rows:
-            for schemafkey, columns, idx in tablefkeys:
-                rowkey = tuple(row[c] for c in columns)
+            for schemafkey, get_key, idx in tablefkeys:
+                rowkey = get_key(row)
                 if rowkey not in idx:
                     raise wsl.IntegrityError('Table "%s" has row "%s" which violates foreign key constraint "%s" (no row corresponding to row key "%s" found in foreign table "%s")' %(schemafkey.table, row, schemafkey.name, rowkey, schemafkey.reftable))
@@ -4,6 +4,11 @@ from .schema import Schema
 from .exceptions import LexError
 
 
+_INT_REGEX = re.compile(r'0|-?[1-9][0-9]*')
+_FLOAT_REGEX = re.compile(r'-?0.[0-9]*|-?[1-9][0-9]*.[0-9]*')
+_WHITESPACE_REGEX = re.compile(r'[\t\n\r ]*')
+
+
 def _chardesc(text, i):
     if i >= len(text):
         return '(end of input)'
@@ -12,16 +17,13 @@ def _chardesc(text, i):
 
 
 def _lex_chars(text, i, chrs):
-    if not text[i:].startswith(chrs):
+    if not text.startswith(chrs, i):
         raise LexError('JSON lexical item "%s"' %(chrs,), text, i, i, 'Did not find expected "%s"' %(chrs,))
     return i + len(chrs)
 
 
 def lex_json_whitespace(text, i):
-    end = len(text)
-    while i < end and ord(text[i]) in [0x09, 0x0a, 0x0d, 0x20]:
-        i += 1
-    return i
+    return _WHITESPACE_REGEX.match(text, i).end()
 
 
 def lex_json_openbrace(text, i):
@@ -74,48 +76,40 @@ def unlex_json_string(token):
 
 def lex_json_int(text, i):
     start = i
-    end = len(text)
-
-    regex = r'0|-?[1-9][0-9]*'
-    m = re.match(regex, text[i:])
+    m = _INT_REGEX.match(text, i)
 
     if m is None:
-        raise LexError('JSON integer literal', text, start, i, 'Integer literals must match /%s/' %(regex,))
+        raise LexError('JSON integer literal', text, start, i, 'Integer literals must match /%s/' %(_INT_REGEX.pattern,))
 
-    i += m.end()
+    i = m.end()
     return i, text[start:i]
 
 
 def unlex_json_int(token):
     if not isinstance(token, str):
         raise TypeError()
-    return str(token)
+    return token
 
 
 def lex_json_float(text, i):
     start = i
-    end = len(text)
-
-    regex = r'-?0.[0-9]*|-?[1-9][0-9]*.[0-9]*'
-    m = re.match(regex, text[i:])
+    m = _FLOAT_REGEX.match(text, i)
 
     if m is None:
-        raise LexError('JSON float literal', text, start, i, 'Float literals must match /%s/' %(regex,))
+        raise LexError('JSON float literal', text, start, i, 'Float literals must match /%s/' %(_FLOAT_REGEX.pattern,))
 
-    i += m.end()
+    i = m.end()
     return i, text[start:i]
 
 
 def unlex_json_float(token):
     if not isinstance(token, str):
         raise TypeError()
-    return str(token)
+    return token
 
 
 def lex_json_null(text, i):
-    start = i
-
-    if text[i:].startswith('null'):
+    if text.startswith('null', i):
         i += 4
         return i
     else:
@@ -127,6 +121,10 @@ def unlex_json_null(token):
     return 'null'
 
 
+_REGEX_LEXERS = {lex_json_int: _INT_REGEX, lex_json_float: _FLOAT_REGEX}
+_CHECKED_UNLEXERS = (unlex_json_int, unlex_json_float)
+
+
 def make_make_jsonreader(schema):
     if not isinstance(schema, Schema):
         raise TypeError()
@@ -134,12 +132,25 @@ def make_make_jsonreader(schema):
         domobj = schema.domains.get(domain)
         if domobj is None:
             return None
-        if not hasattr(domobj.funcs, 'decode'):
-            return None
-        if not hasattr(domobj.funcs, 'jsonlex'):
+        funcs = domobj.funcs
+        decode = getattr(funcs, 'decode', None)
+        jsonlex = getattr(funcs, 'jsonlex', None)
+        if decode is None or jsonlex is None:
             return None
-        decode = domobj.funcs.decode
-        jsonlex = lex_json_string if is_dict_key else domobj.funcs.jsonlex
+        if is_dict_key:
+            jsonlex = lex_json_string
+        regex = _REGEX_LEXERS.get(jsonlex)
+        if regex is not None:
+            # the token is matched inline. On a mismatch the lexer takes
+            # over, which reports the error
+            match = regex.match
+            def jsonreader(text, i):
+                m = match(text, i)
+                if m is None:
+                    i, token = jsonlex(text, i)
+                    return i, decode(token)
+                return m.end(), decode(m.group())
+            return jsonreader
         def jsonreader(text, i):
             i, token = jsonlex(text, i)
             return i, decode(token)
@@ -154,12 +165,21 @@ def make_make_jsonwriter(schema):
         domobj = schema.domains.get(domain)
         if domobj is None:
             return None
-        if not hasattr(domobj.funcs, 'encode'):
-            return None
-        if not hasattr(domobj.funcs, 'jsonunlex'):
+        funcs = domobj.funcs
+        encode = getattr(funcs, 'encode', None)
+        jsonunlex = getattr(funcs, 'jsonunlex', None)
+        if encode is None or jsonunlex is None:
             return None
-        encode = domobj.funcs.encode
-        jsonunlex = unlex_json_string if is_dict_key else domobj.funcs.jsonunlex
+        if is_dict_key:
+            jsonunlex = unlex_json_string
+        if jsonunlex in _CHECKED_UNLEXERS:
+            # these unlexers only check the token type, which is done inline
+            def jsonwriter(value):
+                token = encode(value)
+                if not isinstance(token, str):
+                    raise TypeError()
+                return token
+            return jsonwriter
         def jsonwriter(value):
             return jsonunlex(encode(value))
         return jsonwriter
@@ -4,6 +4,12 @@ from .schema import Schema
 from .exceptions import LexError
 
 
+_INT_REGEX = re.compile(r'0|-?[1-9][0-9]*')
+_FLOAT_REGEX = re.compile(r'-?0.[0-9]*|-?[1-9][0-9]*.[0-9]*')
+_RELATION_NAME_REGEX = re.compile(r'[A-Za-z]+')
+_IDENTIFIER_REGEX = re.compile(r'[^\x00-\x20\x7f]+')
+
+
 def _hex2dec(c):
     x = ord(c)
     if 0x30 <= x <= 0x39:
@@ -27,63 +33,51 @@ def _chardesc(text, i):
 
 
 def lex_wsl_relation_name(text, i):
-    start = i
-    end = len(text)
-    if not 0x41 <= ord(text[i]) <= 0x5a and not 0x61 <= ord(text[i]) <= 0x7a:
-        raise LexError('Table name', text, start, i, 'Invalid character "%c" with no valid characters consumed' %(text[i],))
-    while i < end and (0x41 <= ord(text[i]) <= 0x5a or 0x61 <= ord(text[i]) <= 0x7a):
-        i += 1
-    return i, text[start:i]
+    m = _RELATION_NAME_REGEX.match(text, i)
+    if m is None:
+        raise LexError('Table name', text, i, i, 'Invalid character "%c" with no valid characters consumed' %(text[i],))
+    return m.end(), m.group()
 
 
 def lex_wsl_int(text, i):
     start = i
-    end = len(text)
-
-    regex = r'0|-?[1-9][0-9]*'
-    m = re.match(regex, text[i:])
+    m = _INT_REGEX.match(text, i)
 
     if m is None:
-        raise LexError('WSL integer literal', text, start, i, 'Integer literals must match /%s/' %(regex,))
+        raise LexError('WSL integer literal', text, start, i, 'Integer literals must match /%s/' %(_INT_REGEX.pattern,))
 
-    i += m.end()
+    i = m.end()
     return i, text[start:i]
 
 
 def unlex_wsl_int(token):
     if not isinstance(token, str):
         raise TypeError()
-    return str(token)
+    return token
 
 
 def lex_wsl_float(text, i):
     start = i
-    end = len(text)
-
-    regex = r'-?0.[0-9]*|-?[1-9][0-9]*.[0-9]*'
-    m = re.match(regex, text[i:])
+    m = _FLOAT_REGEX.match(text, i)
 
     if m is None:
-        raise LexError('WSL float literal', text, start, i, 'Float literals must match /%s/' %(regex,))
+        raise LexError('WSL float literal', text, start, i, 'Float literals must match /%s/' %(_FLOAT_REGEX.pattern,))
 
-    i += m.end()
+    i = m.end()
     return i, text[start:i]
 
 
 def unlex_wsl_float(token):
     if not isinstance(token, str):
         raise TypeError()
-    return str(token)
+    return token
 
 
 def lex_wsl_identifier(text, i):
-    start = i
-    end = len(text)
-    while i < end and ord(text[i]) > 0x20 and ord(text[i]) != 0x7f:
-        i += 1
-    if i == start:
-        raise LexError('Identifier literal', text, start, i, 'End of line or invalid character with no valid characters read')
-    return i, text[start:i]
+    m = _IDENTIFIER_REGEX.match(text, i)
+    if m is None:
+        raise LexError('Identifier literal', text, i, i, 'End of line or invalid character with no valid characters read')
+    return m.end(), m.group()
 
 
 def unlex_wsl_identifier(token):
@@ -99,12 +93,10 @@ def lex_wsl_string_without_escapes(text, i):
     if not 0 <= i < end or ord(text[i]) != 0x5b:  # [
         raise LexError('String literal', text, start, i, 'String must begin with "[", found: %s' %(_chardesc(text, i)))
 
-    i += 1
-    while i < end and text[i] != ']':
-        i += 1
+    i = text.find(']', i + 1)
 
-    if i >= end:
-        raise LexError('String literal', text, start, i, 'String must end with "]", but encountered end of input')
+    if i == -1:
+        raise LexError('String literal', text, start, end, 'String must end with "]", but encountered end of input')
 
     return i+1, text[start+1:i]
 
@@ -193,6 +185,10 @@ def lex_wsl_newline(text, i):
     return i+1, None
 
 
+_REGEX_LEXERS = {lex_wsl_int: _INT_REGEX, lex_wsl_float: _FLOAT_REGEX}
+_CHECKED_UNLEXERS = (unlex_wsl_int, unlex_wsl_float)
+
+
 def make_make_wslreader(schema):
     if not isinstance(schema, Schema):
         raise TypeError()
@@ -200,12 +196,23 @@ def make_make_wslreader(schema):
         domobj = schema.domains.get(domain)
         if domobj is None:
             return None
-        if not hasattr(domobj.funcs, 'decode'):
+        funcs = domobj.funcs
+        decode = getattr(funcs, 'decode', None)
+        lex = getattr(funcs, 'wsllex', None)
+        if decode is None or lex is None:
             return None
-        if not hasattr(domobj.funcs, 'wsllex'):
-            return None
-        decode = domobj.funcs.decode
-        lex = domobj.funcs.wsllex
+        regex = _REGEX_LEXERS.get(lex)
+        if regex is not None:
+            # the token is matched inline. On a mismatch the lexer takes
+            # over, which reports the error
+            match = regex.match
+            def wslreader(text, i):
+                m = match(text, i)
+                if m is None:
+                    i, token = lex(text, i)
+                    return i, decode(token)
+                return m.end(), decode(m.group())
+            return wslreader
         def wslreader(text, i):
             i, token = lex(text, i)
             return i, decode(token)
@@ -220,12 +227,19 @@ def make_make_wslwriter(schema):
         domobj = schema.domains.get(domain)
         if domobj is None:
             return None
-        if not hasattr(domobj.funcs, 'encode'):
-            return None
-        if not hasattr(domobj.funcs, 'wslunlex'):
+        funcs = domobj.funcs
+        encode = getattr(funcs, 'encode', None)
+        wslunlex = getattr(funcs, 'wslunlex', None)
+        if encode is None or wslunlex is None:
             return None
-        encode = domobj.funcs.encode
-        wslunlex = domobj.funcs.wslunlex
+        if wslunlex in _CHECKED_UNLEXERS:
+            # these unlexers only check the token type, which is done inline
+            def wslwriter(value):
+                token = encode(value)
+                if not isinstance(token, str):
+                    raise TypeError()
+                return token
+            return wslwriter
         def wslwriter(value):
             return wslunlex(encode(value))
         return wslwriter
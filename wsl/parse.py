@@ -1,5 +1,7 @@
 """Module wsl.parse: Functionality for parsing a WSL database."""
 
+import re
+
 from .domain import get_builtin_domain_parsers
 from .exceptions import ParseError
 from .lexwsl import lex_wsl_newline
@@ -8,6 +10,9 @@ from .lexwsl import lex_wsl_space
 from .schema import Schema, SchemaDomain, SchemaTable, SchemaKey, SchemaForeignKey
 
 
+_NEWLINES_REGEX = re.compile('\n*')
+
+
 def _is_lowercase(c):
     return 0x61 <= ord(c) <= 0x7a
 
@@ -279,7 +284,6 @@ def parse_tokens(text, i, lexers):
     Raises:
         wsl.ParseError: The called lexers raise ParseErrors if lexing fails.
     """
-    end = len(text)
     toks = []
     for lexer in lexers:
         i, _ = lex_wsl_space(text, i)
@@ -306,7 +310,6 @@ def parse_row(text, i, lexers_of_relation):
         wsl.ParseError: if the lex failed.
     """
     start = i
-    end = len(text)
     i, relation = lex_wsl_relation_name(text, i)
     lexers = lexers_of_relation.get(relation)
     if lexers is None:
@@ -405,13 +408,15 @@ def parse_db(dbfilepath=None, dbstr=None, schema=None, schemastr=None, domain_pa
     end = len(text)
     while i < end:
         if text[i] == '#':
-            while i < end and text[i] != '\n':
-                i += 1
-        if text[i] != '\n' and text[i]:
+            i = text.find('\n', i)
+            if i == -1:
+                break
+        if text[i] != '\n':
             i, (table, tup) = parse_row(text, i, lexers_of_relation)
             tokens_of_relation[table].append(tup)
         else:
-            i += 1
+            # runs of blank lines are skipped in one go
+            i = _NEWLINES_REGEX.match(text, i).end()
 
     tables = { table.name: [] for table in schema.tables.values() }
 
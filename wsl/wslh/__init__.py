@@ -3,7 +3,9 @@ from .parse import parse_spec
 from .coverage import check_coverage
 from .objects2rows import objects2rows
 from .objects2text import objects2text
+from .objects2text import objects2bytes
 from .rows2objects import rows2objects
 from .text2objects import text2objects
+from .text2objects import bytes2objects
 from .json2objects import json2objects
 from .objects2json import objects2json
@@ -1,35 +1,40 @@
 import json
 
-from ..exceptions import ParseError, LexError
+from ..exceptions import ParseError, compute_line_and_column
 from .datatypes import Value, Struct, Option, Set, List, Dict
+from .readercache import ReaderCache
 from ..schema import Schema
 from ..lexjson import lex_json_string
-from ..lexjson import lex_json_null
 from ..lexjson import lex_json_whitespace
 from ..lexjson import lex_json_openbrace
-from ..lexjson import lex_json_closebrace
 from ..lexjson import lex_json_openbracket
-from ..lexjson import lex_json_closebracket
 from ..lexjson import lex_json_comma
 from ..lexjson import lex_json_colon
 from ..lexjson import make_make_jsonreader
 
 
 class ParseException(Exception):
-    def __init__(self, msg, lineno, charno):
+    def __init__(self, msg, text, i):
         self.msg = msg
-        self.lineno = lineno
-        self.charno = charno
+        self.text = text
+        self.i = i
+
+    @property
+    def lineno(self):
+        return compute_line_and_column(self.text, self.i)[0]
+
+    @property
+    def charno(self):
+        return compute_line_and_column(self.text, self.i)[1]
 
     def __str__(self):
-        return 'At %d:%d: %s' %(self.lineno, self.charno, self.msg)
+        lineno, charno = compute_line_and_column(self.text, self.i)
+        return 'At %d:%d: %s' %(lineno, charno, self.msg)
 
 
 def make_parse_exc(msg, text, i):
-    lines = text[:i].split('\n')
-    lineno = len(lines)
-    charno = i + 1 - sum(len(l) + 1 for l in lines[:-1])
-    return ParseException(msg, lineno, charno)
+    # line and column are computed only when needed
+    return ParseException(msg, text, i)
 
 
 def value2objects(make_reader, spec, is_dict_key):
@@ -43,6 +48,7 @@ def struct2objects(make_reader, spec, is_dict_key):
     dct = {}
     for k, v in spec.childs.items():
         dct[k] = any2objects(make_reader, v, False)
+    get_reader = dct.get
 
     def struct_reader(text, i):
         structstart = i
@@ -53,11 +59,9 @@ def struct2objects(make_reader, spec, is_dict_key):
 
         while True:
             i = lex_json_whitespace(text, i)
-            try:
-                i = lex_json_closebrace(text, i)
+            if text.startswith('}', i):
+                i += 1
                 break
-            except LexError:
-                pass
 
             if items:
                 i = lex_json_comma(text, i)
@@ -65,7 +69,7 @@ def struct2objects(make_reader, spec, is_dict_key):
 
             kstart = i
             i, k = lex_json_string(text, i)
-            reader = dct.get(k)
+            reader = get_reader(k)
             if reader is None:
                 raise ParseError('JSON struct', text, kstart, i, 'Invalid member: "%s"' %(k,))
             if k in items:
@@ -84,10 +88,11 @@ def struct2objects(make_reader, spec, is_dict_key):
 
             items[k] = v
 
-        needkeys = set(dct.keys())
-        havekeys = set(items.keys())
-        if needkeys != havekeys:
-            raise ParseError('JSON struct', text, structstart, i, 'Missing members: %s' %(', '.join(needkeys.difference(havekeys))))
+        # all members in items are valid and distinct, so only missing
+        # members can make the counts differ
+        if len(items) != len(dct):
+            missing = [k for k in dct if k not in items]
+            raise ParseError('JSON struct', text, structstart, i, 'Missing members: %s' %(', '.join(missing)))
 
         return i, items
 
@@ -98,11 +103,8 @@ def option2objects(make_reader, spec, is_dict_key):
     val_reader = any2objects(make_reader, spec.childs['_val_'], False)
 
     def option_reader(text, i):
-        try:
-            i = lex_json_null(text, i)
-            return i, None
-        except LexError:
-            pass
+        if text.startswith('null', i):
+            return i + 4, None
         return val_reader(text, i)
 
     return option_reader
@@ -123,28 +125,27 @@ def list2objects(make_reader, spec, is_dict_key):
 
     def list_reader(text, i):
         items = []
+        append = items.append
         i = lex_json_whitespace(text, i)
         i = lex_json_openbracket(text, i)
         i = lex_json_whitespace(text, i)
         while True:
             i = lex_json_whitespace(text, i)
-            try:
-                i = lex_json_closebracket(text, i)
+            if text.startswith(']', i):
+                i += 1
                 break
-            except:
-                pass
             if items:
                 i = lex_json_comma(text, i)
                 i = lex_json_whitespace(text, i)
             i, v = val_reader(text, i)
-            items.append(v)
+            append(v)
         return i, items
 
     return list_reader
 
 
 def dict2objects(make_reader, spec, is_dict_key):
-    if type(spec.childs['_key_']) != Value:
+    if type(spec.childs['_key_']) is not Value:
         raise TypeError('JSON does not support composite dictionary keys')
 
     key_reader = any2objects(make_reader, spec.childs['_key_'], True)
@@ -158,11 +159,9 @@ def dict2objects(make_reader, spec, is_dict_key):
 
         while True:
             i = lex_json_whitespace(text, i)
-            try:
-                i = lex_json_closebrace(text, i)
+            if text.startswith('}', i):
+                i += 1
                 break
-            except:
-                pass
 
             if items:
                 i = lex_json_comma(text, i)
@@ -189,29 +188,29 @@ def dict2objects(make_reader, spec, is_dict_key):
     return dict_reader
 
 
-def any2objects(make_reader, spec, is_dict_key):
-    typ = type(spec)
+_DISPATCH = {
+    Value: value2objects,
+    Struct: struct2objects,
+    Option: option2objects,
+    Set: set2objects,
+    List: list2objects,
+    Dict: dict2objects,
+}
 
-    if typ == Value:
-        return value2objects(make_reader, spec, is_dict_key)
 
-    elif typ == Struct:
-        return struct2objects(make_reader, spec, is_dict_key)
+def any2objects(make_reader, spec, is_dict_key):
+    conv = _DISPATCH.get(type(spec))
+    if conv is None:
+        raise TypeError()  # or missing case?
 
-    elif typ == Option:
-        return option2objects(make_reader, spec, is_dict_key)
+    return conv(make_reader, spec, is_dict_key)
 
-    elif typ == Set:
-        return set2objects(make_reader, spec, is_dict_key)
 
-    elif typ == List:
-        return list2objects(make_reader, spec, is_dict_key)
+def compile_reader(spec, schema):
+    return any2objects(make_make_jsonreader(schema), spec, False)
 
-    elif typ == Dict:
-        return dict2objects(make_reader, spec, is_dict_key)
 
-    else:
-        raise TypeError()  # or missing case?
+_READERS = ReaderCache(compile_reader)
 
 
 def json2objects(schema, spec, text):
@@ -220,7 +219,7 @@ def json2objects(schema, spec, text):
     if not isinstance(text, str):
         raise TypeError()
 
-    reader = any2objects(make_make_jsonreader(schema), spec, False)
+    reader = _READERS.get(spec, schema)
 
     i, objects = reader(text, 0)
     return objects
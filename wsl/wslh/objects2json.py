@@ -1,4 +1,5 @@
 import io
+import operator
 
 from ..lexjson import make_make_jsonwriter, unlex_json_string
 from .datatypes import Value, Struct, Option, Set, List, Dict
@@ -6,6 +7,9 @@ from .datatypes import Value, Struct, Option, Set, List, Dict
 
 INDENTSPACES = '  '
 
+# dict items are sorted by key alone, as in objects2text
+_by_key = operator.itemgetter(0)
+
 
 def value2json(look, spec, indent, is_dict_child):
     fmter = look(spec.primtype, is_dict_child)
@@ -17,24 +21,21 @@ def value2json(look, spec, indent, is_dict_child):
 
 
 def struct2json(look, spec, indent):
+    inner = indent + INDENTSPACES
     items = []
-    for key, sub_spec in sorted(spec.childs.items()):
-        write_sub = any2json(look, sub_spec, indent + INDENTSPACES)
-        items.append((key, write_sub))
+    for i, (key, sub_spec) in enumerate(sorted(spec.childs.items())):
+        write_sub = any2json(look, sub_spec, inner)
+        prefix = (',' if i else '') + '\n' + inner + unlex_json_string(key) + ': '
+        items.append((prefix, key, write_sub))
+    start = '{' + indent
+    close = '\n' + indent + '}'
     def write_struct(writer, data):
-        writer.write('{')
-        writer.write(indent)
-        for i, (key, write_sub) in enumerate(items):
-            if i:
-                writer.write(',')
-            writer.write('\n')
-            writer.write(indent + INDENTSPACES)
-            writer.write(unlex_json_string(key))
-            writer.write(': ')
+        write = writer.write
+        write(start)
+        for prefix, key, write_sub in items:
+            write(prefix)
             write_sub(writer, data[key])
-        writer.write('\n')
-        writer.write(indent)
-        writer.write('}')
+        write(close)
     return write_struct
 
 
@@ -52,37 +53,36 @@ def option2json(look, spec, indent):
 def set2json(look, spec, indent):
     sub_spec = spec.childs['_val_']
     write_sub = any2json(look, sub_spec, indent + INDENTSPACES)
+    first_prefix = indent + indent + INDENTSPACES
+    next_prefix = ',\n' + first_prefix
+    close = '\n' + indent + ']'
+    empty_close = indent + ']'
     def write_set(writer, data):
-        writer.write('[\n')
+        write = writer.write
+        write('[\n')
         i = None
         for i, item in enumerate(sorted(data)):
-            if i:
-                writer.write(',\n')
-            writer.write(indent)
-            writer.write(indent + INDENTSPACES)
+            write(next_prefix if i else first_prefix)
             write_sub(writer, item)
-        if i is not None:
-            writer.write('\n')
-        writer.write(indent)
-        writer.write(']')
+        write(empty_close if i is None else close)
     return write_set
 
 
 def list2json(look, spec, indent):
     sub_spec = spec.childs['_val_']
     write_sub = any2json(look, sub_spec, indent + INDENTSPACES)
+    first_prefix = indent + INDENTSPACES
+    next_prefix = ',\n' + first_prefix
+    close = '\n' + indent + ']'
+    empty_close = indent + ']'
     def write_list(writer, data):
-        writer.write('[\n')
+        write = writer.write
+        write('[\n')
         i = None
         for i, item in enumerate(data):
-            if i:
-                writer.write(',\n')
-            writer.write(indent + INDENTSPACES)
+            write(next_prefix if i else first_prefix)
             write_sub(writer, item)
-        if i is not None:
-            writer.write('\n')
-        writer.write(indent)
-        writer.write(']')
+        write(empty_close if i is None else close)
     return write_list
 
 
@@ -92,19 +92,18 @@ def dict2json(look, spec, indent):
     assert type(key_spec) == Value
     write_key = any2json(look, key_spec, indent + INDENTSPACES, is_dict_child=True)
     write_val = any2json(look, val_spec, indent + INDENTSPACES)
+    first_prefix = '\n' + indent + INDENTSPACES
+    next_prefix = ',' + first_prefix
+    close = '\n' + indent + '}'
     def write_dict(writer, data):
-        writer.write('{')
-        for i, (key, val) in enumerate(sorted(data.items())):
-            if i:
-                writer.write(',')
-            writer.write('\n')
-            writer.write(indent + INDENTSPACES)
+        write = writer.write
+        write('{')
+        for i, (key, val) in enumerate(sorted(data.items(), key=_by_key)):
+            write(next_prefix if i else first_prefix)
             write_key(writer, key)
-            writer.write(': ')
+            write(': ')
             write_val(writer, val)
-        writer.write('\n')
-        writer.write(indent)
-        writer.write('}')
+        write(close)
     return write_dict
 
 
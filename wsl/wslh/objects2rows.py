@@ -1,6 +1,11 @@
+import itertools
+
 from .datatypes import Value, Struct, Option, Set, List, Dict, Query
 
 
+_VALID_SPEC_TYPES = (Value, Struct, Option, Set, List, Dict)
+
+
 class Settable():
     def __init__(self):
         self.x = None
@@ -20,11 +25,18 @@ class Settable():
         return self.x
 
 
+def repeat_rows(rows, lengths, freshvariables):
+    """Repeat each row as often as given in *lengths*, and extend each copy
+    with fresh Settables for *freshvariables*"""
+    nfresh = len(freshvariables)
+    parents = itertools.chain.from_iterable(map(itertools.repeat, rows, lengths))
+    return [row + tuple(Settable() for _ in range(nfresh)) for row in parents]
+
+
 def add_rows(query, cols, rows, database):
     key = tuple(cols.index(v) for v in query.variables)
     table = database.setdefault(query.table, [])
-    for row in rows:
-        table.append(tuple(row[i].get() for i in key))
+    table.extend(tuple(row[i].get() for i in key) for row in rows)
 
 
 def value2rows(cols, rows, objs, spec, database):
@@ -50,13 +62,16 @@ def value2rows(cols, rows, objs, spec, database):
 def struct2rows(cols, rows, objs, spec, database):
     nextcols = cols
     nextrows = rows
-    nextobjs = { key: [] for key in spec.childs }
-    for obj in objs:
-        assert obj is not None
-        for key in spec.childs:
-            if key not in obj:
-                raise ValueError('Expected member "%s" but got object with these keys: %s' %(key, ', '.join(str(k) for k in obj.keys())))
-            nextobjs[key].append(obj[key])
+    nextobjs = {}
+    for key in spec.childs:
+        try:
+            nextobjs[key] = [obj[key] for obj in objs]
+        except KeyError:
+            obj = next(obj for obj in objs if key not in obj)
+            raise ValueError('Expected member "%s" but got object with these keys: %s' %(key, ', '.join(str(k) for k in obj.keys()))) from None
+        except TypeError:
+            obj = next(obj for obj in objs if not isinstance(obj, dict))
+            raise ValueError('Expected struct object with member "%s" but got %r' %(key, obj)) from None
     for key in spec.childs:
         any2rows(nextcols, nextrows, nextobjs[key], spec.childs[key], database)
 
@@ -77,27 +92,19 @@ def option2rows(cols, rows, objs, spec, database):
 
 def set2rows(cols, rows, objs, spec, database):
     nextcols = cols + spec.query.freshvariables
-    nextrows = []
-    nextobjs_idxs = []
-    nextobjs_vals = []
-    for row, set_ in zip(rows, objs):
-        for item in set_:
-            nextrows.append(row + tuple(Settable() for _ in spec.query.freshvariables))
-            nextobjs_vals.append(item)
+    lengths = [len(set_) for set_ in objs]
+    nextrows = repeat_rows(rows, lengths, spec.query.freshvariables)
+    nextobjs_vals = list(itertools.chain.from_iterable(objs))
     any2rows(nextcols, nextrows, nextobjs_vals, spec.childs['_val_'], database)
     add_rows(spec.query, nextcols, nextrows, database)
 
 
 def list2rows(cols, rows, objs, spec, database):
     nextcols = cols + spec.query.freshvariables
-    nextrows = []
-    nextobjs_idxs = []
-    nextobjs_vals = []
-    for row, lst in zip(rows, objs):
-        for i, item in enumerate(lst):
-            nextrows.append(row + tuple(Settable() for _ in spec.query.freshvariables))
-            nextobjs_idxs.append(i)
-            nextobjs_vals.append(item)
+    lengths = [len(lst) for lst in objs]
+    nextrows = repeat_rows(rows, lengths, spec.query.freshvariables)
+    nextobjs_idxs = list(itertools.chain.from_iterable(map(range, lengths)))
+    nextobjs_vals = list(itertools.chain.from_iterable(objs))
     any2rows(nextcols, nextrows, nextobjs_idxs, spec.childs['_idx_'], database)
     any2rows(nextcols, nextrows, nextobjs_vals, spec.childs['_val_'], database)
     add_rows(spec.query, nextcols, nextrows, database)
@@ -105,48 +112,37 @@ def list2rows(cols, rows, objs, spec, database):
 
 def dict2rows(cols, rows, objs, spec, database):
     nextcols = cols + spec.query.freshvariables
-    nextrows = []
-    nextobjs_keys = []
-    nextobjs_vals = []
-    for row, dct in zip(rows, objs):
-        for key, val in dct.items():
-            nextrows.append(row + tuple(Settable() for _ in spec.query.freshvariables))
-            nextobjs_keys.append(key)
-            nextobjs_vals.append(val)
+    lengths = [len(dct) for dct in objs]
+    nextrows = repeat_rows(rows, lengths, spec.query.freshvariables)
+    nextobjs_keys = list(itertools.chain.from_iterable(objs))
+    nextobjs_vals = list(itertools.chain.from_iterable(dct.values() for dct in objs))
     any2rows(nextcols, nextrows, nextobjs_keys, spec.childs['_key_'], database)
     any2rows(nextcols, nextrows, nextobjs_vals, spec.childs['_val_'], database)
     add_rows(spec.query, nextcols, nextrows, database)
 
 
-def any2rows(cols, rows, objs, spec, database):
-    assert len(rows) == len(objs)
-
-    typ = type(spec)
-
-    if typ == Value:
-        value2rows(cols, rows, objs, spec, database)
-
-    elif typ == Struct:
-        struct2rows(cols, rows, objs, spec, database)
-
-    elif typ == Option:
-        option2rows(cols, rows, objs, spec, database)
+_DISPATCH = {
+    Value: value2rows,
+    Struct: struct2rows,
+    Option: option2rows,
+    Set: set2rows,
+    List: list2rows,
+    Dict: dict2rows,
+}
 
-    elif typ == Set:
-        set2rows(cols, rows, objs, spec, database)
 
-    elif typ == List:
-        list2rows(cols, rows, objs, spec, database)
-
-    elif typ == Dict:
-        dict2rows(cols, rows, objs, spec, database)
+def any2rows(cols, rows, objs, spec, database):
+    assert len(rows) == len(objs)
 
-    else:
+    conv = _DISPATCH.get(type(spec))
+    if conv is None:
         raise TypeError()  # or missing case?
 
+    conv(cols, rows, objs, spec, database)
+
 
 def objects2rows(schema, spec, objs):
-    if not any(isinstance(spec, t) for t in [Value, Struct, Option, Set, List, Dict]):
+    if not isinstance(spec, _VALID_SPEC_TYPES):
         raise TypeError()
 
     database = {}
@@ -1,4 +1,4 @@
-import io
+import operator
 
 import wsl
 from .datatypes import Value, Struct, Option, Set, List, Dict
@@ -6,132 +6,186 @@ from .datatypes import Value, Struct, Option, Set, List, Dict
 
 INDENTSPACES = '    '
 
+# Dict items are sorted by key alone. Keys are unique, so the order is the
+# same as when sorting the items, but no tuples need to be compared.
+_by_key = operator.itemgetter(0)
 
-def add_whitespace(spec, sub_spec, write):
+_INDENTS = ['']
+
+
+def _indent(depth):
+    while len(_INDENTS) <= depth:
+        _INDENTS.append(_INDENTS[-1] + INDENTSPACES)
+    return _INDENTS[depth]
+
+
+def add_whitespace(look, spec, sub_spec, write_sub):
     if type(sub_spec) == Value:
+        # Value leaves are formatted inline to save a call per written value
+        fmter = lookup_formatter(look, sub_spec)
         if type(spec) in [Struct, Option, Dict]:
-            def spnl(writer, data):
-                writer.write(' ')
-                write(writer, data)
-                writer.write('\n')
+            def spnl(write, data):
+                write(' ')
+                write(fmter(data))
+                write('\n')
             return spnl
         else:
-            def nl_after(writer, data):
-                write(writer, data)
-                writer.write('\n')
+            def nl_after(write, data):
+                write(fmter(data))
+                write('\n')
             return nl_after
     elif type(sub_spec) == Option:
-        def sp(writer, data):
-            writer.write(' ')
-            write(writer, data)
+        def sp(write, data):
+            write(' ')
+            write_sub(write, data)
         return sp
     else:
-        def nl(writer, data):
-            writer.write('\n')
-            write(writer, data)
+        def nl(write, data):
+            write('\n')
+            write_sub(write, data)
         return nl
 
 
-def value2text(look, spec, indent):
+def lookup_formatter(look, spec):
     fmter = look(spec.primtype)
     if fmter is None:
         raise wsl.InvalidArgument('No primvalue formatter for type "%s"' %(spec,))
-    def write_value(writer, data):
-        writer.write(fmter(data))
+    return fmter
+
+
+def value2text(look, spec, depth):
+    fmter = lookup_formatter(look, spec)
+    def write_value(write, data):
+        write(fmter(data))
     return write_value
 
 
-def struct2text(look, spec, indent):
+def struct2text(look, spec, depth):
+    indent = _indent(depth)
     items = []
     for key, sub_spec in sorted(spec.childs.items()):
-        write_sub = any2text(look, sub_spec, indent + INDENTSPACES)
-        items.append((key, add_whitespace(spec, sub_spec, write_sub)))
-    def write_struct(writer, data):
-        for key, write_sub in items:
-            writer.write(indent)
-            writer.write(':')
-            writer.write(key)
-            write_sub(writer, data[key])
+        write_sub = any2text(look, sub_spec, depth + 1)
+        items.append((indent + ':' + key, key, add_whitespace(look, spec, sub_spec, write_sub)))
+    def write_struct(write, data):
+        for prefix, key, write_sub in items:
+            write(prefix)
+            write_sub(write, data[key])
     return write_struct
 
 
-def option2text(look, spec, indent):
+def option2text(look, spec, depth):
     sub_spec = spec.childs['_val_']
-    write_sub = any2text(look, sub_spec, indent)
-    write_sub = add_whitespace(spec, sub_spec, write_sub)
-    def write_option(writer, data):
+    write_sub = any2text(look, sub_spec, depth)
+    write_sub = add_whitespace(look, spec, sub_spec, write_sub)
+    def write_option(write, data):
         if data is None:
-            writer.write('?\n')
+            write('?\n')
         else:
-            writer.write('!')
-            write_sub(writer, data)
+            write('!')
+            write_sub(write, data)
     return write_option
 
 
-def set2text(look, spec, indent):
+def set2text(look, spec, depth):
+    indent = _indent(depth)
     sub_spec = spec.childs['_val_']
-    write_sub = any2text(look, sub_spec, indent + INDENTSPACES)
-    write_sub = add_whitespace(spec, sub_spec, write_sub)
-    def write_set(writer, data):
+    if type(sub_spec) == Value:
+        # plain values are joined into a single chunk
+        fmter = lookup_formatter(look, sub_spec)
+        sep = '\n' + indent
+        def write_set_of_values(write, data):
+            if data:
+                write(indent)
+                write(sep.join(map(fmter, sorted(data))))
+                write('\n')
+        return write_set_of_values
+    write_sub = any2text(look, sub_spec, depth + 1)
+    write_sub = add_whitespace(look, spec, sub_spec, write_sub)
+    def write_set(write, data):
         for item in sorted(data):
-            writer.write(indent)
-            write_sub(writer, item)
+            write(indent)
+            write_sub(write, item)
     return write_set
 
 
-def list2text(look, spec, indent):
+def list2text(look, spec, depth):
+    indent = _indent(depth)
     sub_spec = spec.childs['_val_']
-    write_sub = any2text(look, sub_spec, indent + INDENTSPACES)
-    write_sub = add_whitespace(spec, sub_spec, write_sub)
-    def write_list(writer, data):
+    if type(sub_spec) == Value:
+        # plain values are joined into a single chunk
+        fmter = lookup_formatter(look, sub_spec)
+        sep = '\n' + indent
+        def write_list_of_values(write, data):
+            if data:
+                write(indent)
+                write(sep.join(map(fmter, data)))
+                write('\n')
+        return write_list_of_values
+    write_sub = any2text(look, sub_spec, depth + 1)
+    write_sub = add_whitespace(look, spec, sub_spec, write_sub)
+    def write_list(write, data):
         for item in data:
-            writer.write(indent)
-            write_sub(writer, item)
+            write(indent)
+            write_sub(write, item)
     return write_list
 
 
-def dict2text(look, spec, indent):
+def dict2text(look, spec, depth):
+    indent = _indent(depth)
     key_spec = spec.childs['_key_']
     val_spec = spec.childs['_val_']
     assert type(key_spec) == Value
-    write_key = any2text(look, key_spec, indent + INDENTSPACES)
-    write_val = any2text(look, val_spec, indent + INDENTSPACES)
-    write_val = add_whitespace(spec, val_spec, write_val)
-    def write_dict(writer, data):
-        for key, val in sorted(data.items()):
-            writer.write(indent)
-            write_key(writer, key)
-            write_val(writer, val)
+    fmt_key = lookup_formatter(look, key_spec)
+    if type(val_spec) == Value:
+        # plain key/value pairs are joined into a single chunk
+        fmt_val = lookup_formatter(look, val_spec)
+        sep = '\n' + indent
+        def write_dict_of_values(write, data):
+            if data:
+                write(indent)
+                write(sep.join(fmt_key(key) + ' ' + fmt_val(val) for key, val in sorted(data.items(), key=_by_key)))
+                write('\n')
+        return write_dict_of_values
+    write_val = any2text(look, val_spec, depth + 1)
+    write_val = add_whitespace(look, spec, val_spec, write_val)
+    def write_dict(write, data):
+        for key, val in sorted(data.items(), key=_by_key):
+            write(indent)
+            write(fmt_key(key))
+            write_val(write, val)
     return write_dict
 
 
-def any2text(look, spec, indent):
-    typ = type(spec)
+_DISPATCH = {
+    Value: value2text,
+    Struct: struct2text,
+    Option: option2text,
+    Set: set2text,
+    List: list2text,
+    Dict: dict2text,
+}
 
-    if typ == Value:
-        return value2text(look, spec, indent)
 
-    elif typ == Struct:
-        return struct2text(look, spec, indent)
+def any2text(look, spec, depth):
+    conv = _DISPATCH.get(type(spec))
+    if conv is None:
+        raise TypeError()  # or missing case?
 
-    elif typ == Option:
-        return option2text(look, spec, indent)
+    return conv(look, spec, depth)
 
-    elif typ == Set:
-        return set2text(look, spec, indent)
 
-    elif typ == List:
-        return list2text(look, spec, indent)
+def objects2text(schema, spec, data):
+    write = any2text(wsl.make_make_wslwriter(schema), spec, 0)
+    chunks = []
+    write(chunks.append, data)
+    return ''.join(chunks)
 
-    elif typ == Dict:
-        return dict2text(look, spec, indent)
-
-    else:
-        raise TypeError()  # or missing case?
 
+def objects2bytes(schema, spec, data, encoding='utf-8'):
+    """Like *objects2text*, but return the text encoded as *bytes*.
 
-def objects2text(schema, spec, data):
-    write = any2text(wsl.make_make_wslwriter(schema), spec, '')
-    writer = io.StringIO()
-    write(writer, data)
-    return writer.getvalue()
+    This is a convenience for callers that write to binary files or sockets.
+    It is no faster than encoding the result of *objects2text*, which is
+    exactly what it does.
+    """
+    return objects2text(schema, spec, data).encode(encoding)
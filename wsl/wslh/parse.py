@@ -1,9 +1,22 @@
 import collections
 import re
+import string
 
 from .datatypes import Value, Struct, Option, Set, List, Dict, Reference, Query
 
 
+# also matches struct member names in text2objects
+IDENTIFIER_REGEX = re.compile(r'[a-zA-Z_][a-zA-Z0-9_]*')
+_VARIABLE_REGEX = re.compile(r'[a-zA-Z][a-zA-Z0-9_]*')
+_IDENTIFIER_LIST_REGEX = re.compile(r'\(([a-zA-Z][a-zA-Z0-9_]*(?: [a-zA-Z][a-zA-Z0-9_]*)*)?\)')
+_IDENTIFIER_CHARS = frozenset(string.ascii_letters + string.digits + '_')
+
+# Required childs of collection types, in sorted order
+_VAL_KEYS = ('_val_',)
+_IDX_VAL_KEYS = ('_idx_', '_val_')
+_KEY_VAL_KEYS = ('_key_', '_val_')
+
+
 class ParseError(Exception):
     pass
 
@@ -12,15 +25,19 @@ class PrettyOrderedDict(collections.OrderedDict):
     __repr__ = dict.__repr__
 
 
-class Line(str):
-    """A single-line *str* with line number information for better error messages"""
+class Line:
+    """A single-line *str* with line number information for better error messages
 
-    def __init__(self, string, lineno):
-        str.__init__(string)
-        self.lineno = lineno
+    Attributes:
+        text (str): The contents of the line.
+        lineno (int): The 0-based line number.
+    """
+
+    __slots__ = ('text', 'lineno')
 
-    def __new__(cls, string, lineno):
-        return str.__new__(cls, string)
+    def __init__(self, text, lineno):
+        self.text = text
+        self.lineno = lineno
 
     def desc(self, i=None):
         if i is None:
@@ -30,21 +47,23 @@ class Line(str):
 
 
 def iter_lines(it):
+    """Yield the non-empty lines of *it* as *Line* objects"""
     for i, line in enumerate(it):
-        yield Line(line, i)
+        if line:
+            yield Line(line, i)
 
 
 def parse_sequence(line, i, sequence, typedesc):
-    if not line[i:].startswith(sequence):
+    if not line.text.startswith(sequence, i):
         raise ParseError('Expected "%s" at %s' %(typedesc, line.desc(i)))
     return i + len(sequence)
 
 
 def parse_regex(line, i, regex, typedesc):
-    m = re.match(regex, line[i:])
+    m = regex.match(line.text, i)
     if m is None:
         raise ParseError('Expected "%s" at %s' %(typedesc, line.desc(i)))
-    return i + m.end(0), m.group(0)
+    return m.end(), m.group(0)
 
 
 def parse_space(line, i):
@@ -52,14 +71,18 @@ def parse_space(line, i):
 
 
 def parse_identifier(line, i):
-    return parse_regex(line, i, r'[a-zA-Z_][a-zA-Z0-9_]*', 'identifier token')
+    return parse_regex(line, i, IDENTIFIER_REGEX, 'identifier token')
 
 
 def parse_variable(line, i):
-    return parse_regex(line, i, r'[a-zA-Z][a-zA-Z0-9_]*', 'variable name')
+    return parse_regex(line, i, _VARIABLE_REGEX, 'variable name')
 
 
 def parse_keyword(line, i, keyword, desc):
+    end = i + len(keyword)
+    if line.text.startswith(keyword, i) and line.text[end:end+1] not in _IDENTIFIER_CHARS:
+        return end
+    # Not the keyword. Lex the identifier for a helpful error message
     try:
         i, kw = parse_identifier(line, i)
     except ParseError as e:
@@ -70,7 +93,6 @@ def parse_keyword(line, i, keyword, desc):
 
 
 def parse_index(line, i):
-    end = len(line)
     try:
         i = parse_sequence(line, i, '[', 'opening bracket "["')
         i, name = parse_variable(line, i)
@@ -82,11 +104,15 @@ def parse_index(line, i):
 
 def parse_identifier_list(line, i, empty_allowed):
     """Parse a list of identifiers in parentheses, like (a b c)"""
-    end = len(line)
+    m = _IDENTIFIER_LIST_REGEX.match(line.text, i)
+    if m is not None and (m.group(1) or empty_allowed):
+        return m.end(), tuple(m.group(1).split(' ')) if m.group(1) else ()
+    # slow path, for a precise error message
+    end = len(line.text)
     i = parse_sequence(line, i, '(', '"(" character')
     vs = []
     while i < end:
-        if line[i] == ')':
+        if line.text[i] == ')':
             if not vs and not empty_allowed:
                 raise ParseError('Empty identifier list not allowed at %s' %(line.desc(i),))
             break
@@ -109,11 +135,9 @@ def parse_clause(line, i):
 
 
 def parse_indent(line):
-    end = len(line)
-    i = 0
-    while i < end and line[i] == ' ':
-        i += 1
-    if i < end and line[i] == '\t':
+    stripped = line.text.lstrip(' ')
+    i = len(line.text) - len(stripped)
+    if stripped.startswith('\t'):
         raise ParseError('Tabs not allowed for indent at %s' %(line.desc(i),))
     indent = i
     return i, indent
@@ -128,21 +152,30 @@ def parse_member_type(line, i):
 
 
 def parse_member_variable(line, i):
-    end = len(line)
-    i, name = parse_identifier(line, i)
-    index = None
-    child = None
-    if i < end and line[i] == '[':
-        i, index = parse_index(line, i)
-    if i < end and line[i] == '.':
+    end = len(line.text)
+    parts = []
+    while True:
+        i, name = parse_identifier(line, i)
+        index = None
+        if i < end and line.text[i] == '[':
+            i, index = parse_index(line, i)
+        parts.append((name, index))
+        if not (i < end and line.text[i] == '.'):
+            break
         i += 1
-        i, child = parse_member_variable(line, i)
-    return i, Reference(name=name, index=index, child=child)
+    ref = None
+    for name, index in reversed(parts):
+        ref = Reference(name=name, index=index, child=ref)
+    return i, ref
 
 
 def parse_query(line, i):
-    i = parse_keyword(line, i, 'for', '(optional) "for" keyword')
-    i = parse_space(line, i)
+    if line.text.startswith('for ', i):
+        i += 4
+    else:
+        # slow path, raises the appropriate error
+        i = parse_keyword(line, i, 'for', '(optional) "for" keyword')
+        i = parse_space(line, i)
     i, freshvariables = parse_freshvars(line, i)
     i = parse_space(line, i)
     i, (table, variables) = parse_clause(line, i)
@@ -167,7 +200,7 @@ def parse_line(line):
       LPAREN           := "("
       RPAREN           := ")"
     """
-    end = len(line)
+    end = len(line.text)
 
     i, indent = parse_indent(line)
 
@@ -209,11 +242,24 @@ def parse_line(line):
 
 
 def parse_lines(lines):
-    return [parse_line(line) for line in iter_lines(lines) if line]
-
-
-def lookup_type(wslschema, table, col_index_0based):
-    return wslschema.tables[table].columns[col_index_0based]
+    return list(map(parse_line, iter_lines(lines)))
+
+
+def infer_types(wslschema, primtypes, query, line, membervariable):
+    """Add the types of the fresh variables of *query* to *primtypes*, and
+    check the types of the other variables against the schema"""
+    table = wslschema.tables.get(query.table)
+    if table is None:
+        raise ParseError('No such table: %s' %(query.table,))
+    if len(table.columns) != len(query.variables):
+        raise ParseError('Arity mismatch: Query %s has %d variables, but table from schema has %d columns' %(query, len(query.variables), len(table.columns)))
+    for v, typ in zip(query.variables, table.columns):
+        if v in query.freshvariables:
+            primtypes[v] = typ
+        elif v not in primtypes:
+            raise ParseError('Variable "%s" not in scope at %s' %(v, line.desc()))
+        elif primtypes[v] != typ:
+            raise ParseError('Type mismatch: Usage of variable "%s" in this place of the query requires type "%s", but it was inferred to be of type "%s"' %(membervariable, typ, primtypes[v]))
 
 
 def parse_tree(wslschema, lines, parent_primtypes=None, li=None, curindent=None):
@@ -236,24 +282,8 @@ def parse_tree(wslschema, lines, parent_primtypes=None, li=None, curindent=None)
 
         primtypes = dict(parent_primtypes)
 
-
-        def infer_types(query):
-            table = wslschema.tables.get(query.table)
-            if table is None:
-                raise ParseError('No such table: %s' %(query.table,))
-            if len(table.columns) != len(query.variables):
-                raise ParseError('Arity mismatch: Query %s has %d variables, but table from schema has %d columns' %(query, len(query.variables), len(table.columns)))
-            for i, v in enumerate(query.variables):
-                typ = lookup_type(wslschema, query.table, i)
-                if v in query.freshvariables:
-                    primtypes[v] = typ
-                elif v not in primtypes:
-                    raise ParseError('Variable "%s" not in scope at %s' %(v, line.desc()))
-                elif primtypes[v] != typ:
-                    raise ParseError('Type mismatch: Usage of variable "%s" in this place of the query requires type "%s", but it was inferred to be of type "%s"' %(membervariable, typ, primtypes[v]))
-
         if query is not None:
-            infer_types(query)
+            infer_types(wslschema, primtypes, query, line, membervariable)
 
         if membertype in ["struct", "option", "set", "list", "dict"]:
             assert membervariable is None
@@ -268,22 +298,22 @@ def parse_tree(wslschema, lines, parent_primtypes=None, li=None, curindent=None)
                 spec = Struct(childs, query)
 
             elif membertype == "option":
-                if set(childs) != set(['_val_']):
+                if tuple(sorted(childs)) != _VAL_KEYS:
                     raise ParseError('Option member at %s: Need _val_ child (and no more)' %(line.desc(),))
                 spec = Option(childs, query)
 
             elif membertype == "set":
-                if set(childs) != set(['_val_']):
+                if tuple(sorted(childs)) != _VAL_KEYS:
                     raise ParseError('Set member at %s: Need _val_ child (and no more)' %(line.desc(),))
                 spec = Set(childs, query)
 
             elif membertype == "list":
-                if set(childs) != set(['_idx_', '_val_']):
+                if tuple(sorted(childs)) != _IDX_VAL_KEYS:
                     raise ParseError('List member at %s: Need _idx_ and _val_ childs (and no more)' %(line.desc()))
                 spec = List(childs, query)
 
             elif membertype == "dict":
-                if set(childs) != set(['_key_', '_val_']):
+                if tuple(sorted(childs)) != _KEY_VAL_KEYS:
                     raise ParseError('Dict member at %s: Need _key_ and _val_ childs (and no more)' %(line.desc()))
                 spec = Dict(childs, query)
 
@@ -0,0 +1,28 @@
+import weakref
+
+
+class ReaderCache:
+    """Compiled readers, cached per tuple of key objects.
+
+    Each key object is held weakly, one level of nested dicts per key, so
+    the cache doesn't keep specs or schemas alive.
+    """
+
+    def __init__(self, compile):
+        self.compile = compile
+        self.readers = weakref.WeakKeyDictionary()
+
+    def get(self, *keys):
+        """Get the reader for *keys*. It is compiled on first use"""
+        dct = self.readers
+        for key in keys[:-1]:
+            inner = dct.get(key)
+            if inner is None:
+                inner = weakref.WeakKeyDictionary()
+                dct[key] = inner
+            dct = inner
+        reader = dct.get(keys[-1])
+        if reader is None:
+            reader = self.compile(*keys)
+            dct[keys[-1]] = reader
+        return reader
@@ -1,150 +1,423 @@
+import operator
+
 from .datatypes import Value, Struct, Option, Set, List, Dict, Query
+from .readercache import ReaderCache
+
 
+_VALID_SPEC_TYPES = (Value, Struct, Option, Set, List, Dict)
 
-def find_child_rows(cols, rows, objs, query, database):
-    assert len(rows) == len(objs)
 
-    freshidxs = tuple(i for i, v in enumerate(query.variables) if v in query.freshvariables)
-    fkeyvars = [v for v in query.variables if v not in query.freshvariables]
-    fkey_local = tuple(query.variables.index(v) for v in fkeyvars)
-    fkey_foreign = tuple(cols.index(v) for v in fkeyvars)
+def make_tuple_getter(idxs):
+    """Make a function that extracts the values at *idxs* from a row, as a tuple"""
+    if len(idxs) == 0:
+        return lambda row: ()
+    elif len(idxs) == 1:
+        i, = idxs
+        return lambda row: (row[i],)
+    else:
+        return operator.itemgetter(*idxs)
+
 
-    index = {}
+def positions(names):
+    """Map each name to the index of its first occurrence in *names*"""
+    pos = {}
+    for i, name in enumerate(names):
+        pos.setdefault(name, i)
+    return pos
 
-    for row, obj in zip(rows, objs):
-        key = tuple(row[i] for i in fkey_foreign)
-        index[key] = row, obj, []
 
-    newcols = cols + query.freshvariables
-    newrows = []
-    newobjs = []
+_MISSING = object()
 
-    for row in database[query.table]:
-        key = tuple(row[i] for i in fkey_local)
-        frow, fobj, flist = index[key]
-        newrow = frow + tuple(row[i] for i in freshidxs)
-        flist.append(newrow)
-        newrows.append(newrow)
-        newobjs.append(fobj)
 
-    return newcols, newrows, newobjs, index.values()
+def order_by_index(pairs):
+    """Get the values of a list of *(idx, val)* pairs, ordered by *idx*.
 
+    Indices that are exactly 0..n-1 are placed directly, which is the common
+    case. Other indices are sorted.
+    """
+    n = len(pairs)
+    out = [_MISSING] * n
+    for idx, val in pairs:
+        if type(idx) is not int or not 0 <= idx < n or out[idx] is not _MISSING:
+            return [val for idx, val in sorted(pairs)]
+        out[idx] = val
+    return out
 
-def value2objects(cols, rows, objs, spec, database):
+
+def referenced_variables(spec):
+    """Get the set of variables that are referenced in *spec*.
+
+    This includes the fresh variables of the queries in *spec*. A fresh
+    variable can reuse the name of a variable that is bound outside, and
+    values then read the outer column, so that column must be kept.
+    """
+    if type(spec) == Value:
+        return {spec.variable}
+    names = set()
+    for child in spec.childs.values():
+        names |= referenced_variables(child)
+    if spec.query is not None:
+        names |= set(spec.query.variables)
+    return names
+
+
+class TableIndex:
+    """Hash indices on the tables of a database, built on first use.
+
+    Each index maps the values of some key columns to the list of rows of
+    the table that hold these values. Indices are shared by all queries that
+    join the same table on the same columns.
+    """
+
+    def __init__(self, database):
+        self.database = database
+        self.indices = {}
+
+    def lookup(self, table, keyidxs):
+        index = self.indices.get((table, keyidxs))
+        if index is None:
+            rows = self.database[table]
+            index = {}
+            setdefault = index.setdefault
+            # the key columns of all rows are extracted in one sweep
+            for key, row in zip(map(make_tuple_getter(keyidxs), rows), rows):
+                setdefault(key, []).append(row)
+            self.indices[(table, keyidxs)] = index
+        return index
+
+
+def make_child_rows_finder(cols, query, childs):
+    """Make a function that joins rows with the rows of the table of *query*.
+
+    The resulting rows hold only the columns that are used in the *childs*
+    specs, so rows don't grow with the nesting depth of the spec.
+
+    Each finder runs once per conversion, over all parent rows at once, so
+    there is nothing to memoize per call. The per-table work that queries
+    have in common is shared through the *TableIndex*.
+
+    Returns:
+        A 2-tuple *(newcols, find_child_rows)*. *newcols* are the columns of
+        the resulting rows. *find_child_rows(rows, objs, tables)* returns a
+        2-tuple *(newrows, newobjs)*.
+    """
+    needed = set()
+    for child in childs:
+        needed |= referenced_variables(child)
+    keptcols = tuple(v for v in cols if v in needed)
+    keptfresh = tuple(v for v in query.freshvariables if v in needed)
+
+    colpos = positions(cols)
+    varpos = positions(query.variables)
+    freshvariables = set(query.freshvariables)
+
+    fkeyvars = [v for v in query.variables if v not in freshvariables]
+    fkey_local = tuple(varpos[v] for v in fkeyvars)
+    fkey_foreign = tuple(colpos[v] for v in fkeyvars)
+
+    get_foreign_key = make_tuple_getter(fkey_foreign)
+    get_kept = make_tuple_getter(tuple(colpos[v] for v in keptcols))
+    get_fresh = make_tuple_getter(tuple(varpos[v] for v in keptfresh))
+
+    table = query.table
+
+    def find_child_rows(rows, objs, tables):
+        assert len(rows) == len(objs)
+
+        index = {}
+
+        for row, obj in zip(rows, objs):
+            index[get_foreign_key(row)] = get_kept(row), obj
+
+        newrows = []
+        newobjs = []
+        extend_rows = newrows.extend
+        extend_objs = newobjs.extend
+
+        # Matches are emitted per parent, as one chunk each. If no fresh
+        # columns are kept, all rows of a chunk are the parent row itself.
+        table_index = tables.lookup(table, fkey_local)
+        get_matches = table_index.get
+        nmatched = 0
+        for key, (frow, fobj) in index.items():
+            matches = get_matches(key)
+            if matches is None:
+                continue
+            nmatched += 1
+            if keptfresh:
+                chunk = [frow + get_fresh(row) for row in matches]
+            else:
+                chunk = [frow] * len(matches)
+            extend_rows(chunk)
+            extend_objs([fobj] * len(chunk))
+
+        # every row of the table must belong to a parent
+        if nmatched != len(table_index):
+            for key in table_index:
+                if key not in index:
+                    raise KeyError(key)
+
+        return newrows, newobjs
+
+    return keptcols + keptfresh, find_child_rows
+
+
+def value2objects(spec, cols):
     if spec.query is not None:
-        newcols, newrows, newobjs, _ = find_child_rows(cols, rows, objs, spec.query, database)
+        cols, find_child_rows = make_child_rows_finder(cols, spec.query, [spec])
     else:
-        newcols, newrows, newobjs = cols, rows, objs
+        find_child_rows = None
+
+    get_value = operator.itemgetter(cols.index(spec.variable))
+
+    def value_reader(rows, objs, tables):
+        if find_child_rows is not None:
+            rows, objs = find_child_rows(rows, objs, tables)
+        return list(zip(objs, map(get_value, rows)))
+
+    return value_reader
+
+
+def struct2objects(spec, cols):
+    # Value children without a query are read straight from the rows, all in
+    # one pass. The other children need their own readers.
+    colpos = positions(cols)
+    leaves = []
+    readers = []
+    for key, child in spec.childs.items():
+        if type(child) == Value and child.query is None:
+            leaves.append((key, colpos[child.variable]))
+        else:
+            readers.append((key, any2objects(child, cols)))
+
+    if not readers:
+        def struct_reader(rows, objs, tables):
+            return [(obj, {key: row[i] for key, i in leaves})
+                    for obj, row in zip(objs, rows)]
+        return struct_reader
+
+    template = dict.fromkeys(spec.childs)
+
+    def struct_reader(rows, objs, tables):
+        n = len(objs)
+        structs = [template.copy() for _ in range(n)]
+        ids = range(n)
+
+        for struct, row in zip(structs, rows):
+            for key, i in leaves:
+                struct[key] = row[i]
+
+        for key, reader in readers:
+            pairs = reader(rows, ids, tables)
+            for i, val in pairs:
+                structs[i][key] = val
+
+        return list(zip(objs, structs))
+
+    return struct_reader
+
+
+def leaf_column(spec, cols):
+    """Get the column index of *spec* if it is a Value without a query, else None"""
+    if type(spec) == Value and spec.query is None:
+        return cols.index(spec.variable)
+    return None
+
+
+def option2objects(spec, cols):
+    newcols, find_child_rows = make_child_rows_finder(cols, spec.query, spec.childs.values())
+    val_spec = spec.childs['_val_']
+    vi = leaf_column(val_spec, newcols)
+
+    if vi is not None:
+        get_value = operator.itemgetter(vi)
+
+        def option_reader(rows, objs, tables):
+            n = len(objs)
+            values = [None] * n
+
+            newrows, newids = find_child_rows(rows, range(n), tables)
 
-    idx = newcols.index(spec.variable)
-    return [(newobj, newrow[idx]) for newobj, newrow in zip(newobjs, newrows)]
+            for i, val in zip(newids, map(get_value, newrows)):
+                values[i] = val
 
+            return list(zip(objs, values))
 
-def struct2objects(cols, rows, objs, spec, database):
-    structs = [{} for _ in objs]
-    ids = range(len(objs))
+        return option_reader
 
-    for i in ids:
-        structs[i] = {}
+    val_reader = any2objects(val_spec, newcols)
 
-    for key in spec.childs:
-        pairs = any2objects(cols, rows, ids, spec.childs[key], database)
+    def option_reader(rows, objs, tables):
+        n = len(objs)
+        values = [None] * n
+        ids = range(n)
+
+        newrows, newids = find_child_rows(rows, ids, tables)
+
+        pairs = val_reader(newrows, newids, tables)
         for i, val in pairs:
-            structs[i][key] = val
+            values[i] = val
 
-    return list(zip(objs, structs))
+        return list(zip(objs, values))
 
+    return option_reader
 
-def option2objects(cols, rows, objs, spec, database):
-    values = [None] * len(objs)
-    ids = range(len(objs))
 
-    newcols, newrows, newids, _ = find_child_rows(cols, rows, ids, spec.query, database)
+def set2objects(spec, cols):
+    newcols, find_child_rows = make_child_rows_finder(cols, spec.query, spec.childs.values())
+    val_spec = spec.childs['_val_']
+    vi = leaf_column(val_spec, newcols)
 
-    pairs = any2objects(newcols, newrows, newids, spec.childs['_val_'], database)
-    for i, val in pairs:
-        values[i] = val
+    if vi is not None:
+        get_value = operator.itemgetter(vi)
 
-    return list(zip(objs, values))
+        def set_reader(rows, objs, tables):
+            sets = [set() for _ in objs]
 
+            newrows, newobjs = find_child_rows(rows, sets, tables)
 
-def set2objects(cols, rows, objs, spec, database):
-    sets = [set() for _ in objs]
+            for set_, val in zip(newobjs, map(get_value, newrows)):
+                set_.add(val)
 
-    newcols, newrows, newobjs, _ = find_child_rows(cols, rows, sets, spec.query, database)
+            return list(zip(objs, sets))
 
-    pairs = any2objects(newcols, newrows, newobjs, spec.childs['_val_'], database)
+        return set_reader
 
-    for set_, value in pairs:
-        set_.add(value)
+    val_reader = any2objects(val_spec, newcols)
 
-    return list(zip(objs, sets))
+    def set_reader(rows, objs, tables):
+        sets = [set() for _ in objs]
 
+        newrows, newobjs = find_child_rows(rows, sets, tables)
 
-def list2objects(cols, rows, objs, spec, database):
-    lsts = [[] for _ in objs]
+        pairs = val_reader(newrows, newobjs, tables)
 
-    newcols, newrows, newobjs, _ = find_child_rows(cols, rows, lsts, spec.query, database)
+        for set_, value in pairs:
+            set_.add(value)
 
-    idxpairs = any2objects(newcols, newrows, newobjs, spec.childs['_idx_'], database)
-    valpairs = any2objects(newcols, newrows, newobjs, spec.childs['_val_'], database)
-    assert len(idxpairs) == len(valpairs)
-    for (lst1, idx), (lst2, val) in zip(idxpairs, valpairs):
-        assert lst1 is lst2
-        lst1.append((idx, val))
+        return list(zip(objs, sets))
 
-    return [(obj, [val for idx, val in sorted(lst)]) for (obj, lst) in zip(objs, lsts)]
+    return set_reader
 
 
-def dict2objects(cols, rows, objs, spec, database):
-    dcts = [{} for _ in objs]
+def list2objects(spec, cols):
+    newcols, find_child_rows = make_child_rows_finder(cols, spec.query, spec.childs.values())
+    idx_spec = spec.childs['_idx_']
+    val_spec = spec.childs['_val_']
+    ii = leaf_column(idx_spec, newcols)
+    vi = leaf_column(val_spec, newcols)
 
-    newcols, newrows, newobjs, _ = find_child_rows(cols, rows, dcts, spec.query, database)
+    if ii is not None and vi is not None:
+        get_pair = operator.itemgetter(ii, vi)
 
-    keypairs = any2objects(newcols, newrows, newobjs, spec.childs['_key_'], database)
-    valpairs = any2objects(newcols, newrows, newobjs, spec.childs['_val_'], database)
-    assert len(keypairs) == len(valpairs)
-    for (dct1, key), (dct2, val) in zip(keypairs, valpairs):
-        assert dct1 is dct2
-        dct1[key] = val
+        def list_reader(rows, objs, tables):
+            lsts = [[] for _ in objs]
 
-    return list(zip(objs, dcts))
+            newrows, newobjs = find_child_rows(rows, lsts, tables)
 
+            for lst, pair in zip(newobjs, map(get_pair, newrows)):
+                lst.append(pair)
 
-def any2objects(cols, rows, objs, spec, database):
-    assert len(rows) == len(objs)
+            return [(obj, order_by_index(lst)) for (obj, lst) in zip(objs, lsts)]
 
-    typ = type(spec)
+        return list_reader
 
-    if typ == Value:
-        return value2objects(cols, rows, objs, spec, database)
+    idx_reader = any2objects(idx_spec, newcols)
+    val_reader = any2objects(val_spec, newcols)
 
-    elif typ == Struct:
-        return struct2objects(cols, rows, objs, spec, database)
+    def list_reader(rows, objs, tables):
+        lsts = [[] for _ in objs]
 
-    elif typ == Option:
-        return option2objects(cols, rows, objs, spec, database)
+        newrows, newobjs = find_child_rows(rows, lsts, tables)
 
-    elif typ == Set:
-        return set2objects(cols, rows, objs, spec, database)
+        idxpairs = idx_reader(newrows, newobjs, tables)
+        valpairs = val_reader(newrows, newobjs, tables)
+        # both readers yield their pairs in the order of newobjs
+        assert len(idxpairs) == len(valpairs)
+        for (lst, idx), (_, val) in zip(idxpairs, valpairs):
+            lst.append((idx, val))
 
-    elif typ == List:
-        return list2objects(cols, rows, objs, spec, database)
+        return [(obj, order_by_index(lst)) for (obj, lst) in zip(objs, lsts)]
 
-    elif typ == Dict:
-        return dict2objects(cols, rows, objs, spec, database)
+    return list_reader
 
-    else:
+
+def dict2objects(spec, cols):
+    newcols, find_child_rows = make_child_rows_finder(cols, spec.query, spec.childs.values())
+    key_spec = spec.childs['_key_']
+    val_spec = spec.childs['_val_']
+    ki = leaf_column(key_spec, newcols)
+    vi = leaf_column(val_spec, newcols)
+
+    if ki is not None and vi is not None:
+        get_pair = operator.itemgetter(ki, vi)
+
+        def dict_reader(rows, objs, tables):
+            dcts = [{} for _ in objs]
+
+            newrows, newobjs = find_child_rows(rows, dcts, tables)
+
+            for dct, (key, val) in zip(newobjs, map(get_pair, newrows)):
+                dct[key] = val
+
+            return list(zip(objs, dcts))
+
+        return dict_reader
+
+    key_reader = any2objects(key_spec, newcols)
+    val_reader = any2objects(val_spec, newcols)
+
+    def dict_reader(rows, objs, tables):
+        dcts = [{} for _ in objs]
+
+        newrows, newobjs = find_child_rows(rows, dcts, tables)
+
+        keypairs = key_reader(newrows, newobjs, tables)
+        valpairs = val_reader(newrows, newobjs, tables)
+        # both readers yield their pairs in the order of newobjs
+        assert len(keypairs) == len(valpairs)
+        for (dct, key), (_, val) in zip(keypairs, valpairs):
+            dct[key] = val
+
+        return list(zip(objs, dcts))
+
+    return dict_reader
+
+
+_DISPATCH = {
+    Value: value2objects,
+    Struct: struct2objects,
+    Option: option2objects,
+    Set: set2objects,
+    List: list2objects,
+    Dict: dict2objects,
+}
+
+
+def any2objects(spec, cols):
+    conv = _DISPATCH.get(type(spec))
+    if conv is None:
         raise TypeError()  # or missing case?
 
+    return conv(spec, cols)
+
+
+def compile_reader(spec):
+    return any2objects(spec, ())
+
+
+_READERS = ReaderCache(compile_reader)
+
 
 def rows2objects(schema, spec, database):
-    if not any(isinstance(spec, t) for t in [Value, Struct, Option, Set, List, Dict]):
+    if not isinstance(spec, _VALID_SPEC_TYPES):
         raise TypeError()
     if not isinstance(database, dict):
         raise TypeError()
 
-    [(topobj, subobj)] = any2objects((), [()], [None], spec, database)
+    reader = _READERS.get(spec)
+
+    [(topobj, subobj)] = reader([()], [None], TableIndex(database))
     assert topobj is None
 
     return subobj
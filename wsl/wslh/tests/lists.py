@@ -51,5 +51,6 @@ def testit():
     print(x)
 
     y = wslh.text2objects(myschema, myspec, x)
+    assert y == objs
 
 testit()
@@ -1,7 +1,12 @@
+import gc
 import json
+import pickle
+import sys
+import weakref
 
 import wsl
 import wsl.wslh as wslh
+from wsl.wslh.readercache import ReaderCache
 
 
 def canonical_json(objs):
@@ -178,6 +183,246 @@ def test_objects2json():
     return thejson
 
 
+def test_shadowed_variable():
+    print()
+    print('TESTING rows2objects() with a shadowed variable...')
+    print('==================================================')
+    print()
+
+    schema = wsl.parse_schema("""
+DOMAIN Int Int
+TABLE A Int Int
+TABLE B Int Int
+""")
+    tables = { 'A': [(1, 1)], 'B': [(1, 7), (1, 8)] }
+
+    # the fresh v of the inner query reuses the name of the outer v
+    alone = wslh.parse_spec(schema, """\
+as: dict for (p v) (A p v)
+    _key_: value p
+    _val_: struct
+        b: set for (v) (B p v)
+            _val_: value v
+""")
+    with_sibling = wslh.parse_spec(schema, """\
+as: dict for (p v) (A p v)
+    _key_: value p
+    _val_: struct
+        a: value v
+        b: set for (v) (B p v)
+            _val_: value v
+""")
+
+    objects = wslh.rows2objects(schema, alone, tables)
+    objects2 = wslh.rows2objects(schema, with_sibling, tables)
+
+    print(objects)
+    print(objects2)
+
+    assert objects == { 'as': { 1: { 'b': {1} } } }
+    assert objects2 == { 'as': { 1: { 'a': 1, 'b': {1} } } }
+
+
+def test_json_factories():
+    make_reader = wsl.make_make_jsonreader(myschema)
+    make_writer = wsl.make_make_jsonwriter(myschema)
+
+    reader = make_reader(domain='Int', is_dict_key=False)
+    writer = make_writer(domain='Int', is_dict_key=False)
+
+    assert reader('42', 0) == (2, 42)
+    assert writer(42) == '42'
+
+
+def test_reader_cache():
+    compiled = []
+    def compile(spec, schema):
+        compiled.append(spec)
+        return object()
+    cache = ReaderCache(compile)
+
+    spec = wslh.parse_spec(myschema, 'cs: set for (c d) (bar c d)\n    _val_: value c\n')
+    reader = cache.get(spec, myschema)
+    assert cache.get(spec, myschema) is reader
+    assert len(compiled) == 1
+
+    # the converters' caches don't keep the spec alive either
+    assert wslh.text2objects(myschema, spec, ':cs\n    3\n') == { 'cs': {3} }
+    assert wslh.json2objects(myschema, spec, '{ "cs": [3] }') == { 'cs': {3} }
+    assert wslh.rows2objects(myschema, spec, mytables) == { 'cs': {3, 6, 42} }
+
+    ref = weakref.ref(spec)
+    del spec, reader, compiled[:]
+    gc.collect()
+    assert ref() is None
+
+
+def expect_error(exc, schema, spec, text, *fragments):
+    try:
+        wslh.text2objects(schema, spec, text)
+    except exc as e:
+        for fragment in fragments:
+            assert fragment in str(e), str(e)
+    else:
+        assert False, 'No %s for %r' %(exc.__name__, text)
+
+
+def test_list_of_values():
+    schema = wsl.parse_schema("""
+DOMAIN Int Int
+DOMAIN IPv4 IPv4
+TABLE foo Int Int
+TABLE host Int IPv4
+""")
+    spec = wslh.parse_spec(schema, """\
+xs: list for (i x) (foo i x)
+    _idx_: value i
+    _val_: value x
+ips: list for (i ip) (host i ip)
+    _idx_: value i
+    _val_: value ip
+""")
+
+    objects = wslh.text2objects(schema, spec, ':ips\n    1.2.3.4\n:xs\n    1\n    2\n')
+    assert objects == { 'xs': [1, 2], 'ips': [(1, 2, 3, 4)] }
+
+    # value that lexes, but fails to decode
+    expect_error(wsl.ParseError, schema, spec, ':ips\n    1.2.3.x\n:xs\n', 'IPv4')
+    # over-indented line
+    expect_error(wsl.ParseError, schema, spec, ':ips\n:xs\n    1\n     2\n', 'At line 4 char 1', 'unexpected indent of 5')
+    # malformed line
+    expect_error(wsl.LexError, schema, spec, ':ips\n:xs\n    1\n    2 x\n', 'At line 4 char 6')
+    # unterminated last line
+    expect_error(wsl.LexError, schema, spec, ':ips\n:xs\n    1\n    2', 'At line 4 char 6')
+
+    # a list at indent 0
+    toplist = wslh.List({ '_idx_': wslh.Value('i', None, 'Int'),
+                          '_val_': wslh.Value('x', None, 'Int') },
+                        wslh.Query(('i', 'x'), 'foo', ('i', 'x')))
+    assert wslh.text2objects(schema, toplist, '1\n2\n') == [1, 2]
+    expect_error(wsl.LexError, schema, toplist, '1\nx\n', 'At line 2 char 1')
+
+
+def test_db_trailing_comment():
+    _, tables = wsl.parse_db(schema=myschema, dbstr='bar 3 666\n# no newline at the end')
+    assert tables == { 'foo': [], 'bar': [(3, 666)] }
+
+
+def test_list_indices():
+    order_by_index = sys.modules['wsl.wslh.rows2objects'].order_by_index
+
+    cases = [
+        [(2, 'c'), (0, 'a'), (1, 'b')],   # dense
+        [(5, 'c'), (0, 'a'), (2, 'b')],   # sparse
+        [(1, 'b'), (1, 'a'), (0, 'c')],   # repeated
+        [(-1, 'a'), (0, 'b')],            # negative
+        [],
+    ]
+    for pairs in cases:
+        assert order_by_index(pairs) == [val for idx, val in sorted(pairs)], pairs
+
+    schema = wsl.parse_schema("""
+DOMAIN Int Int
+DOMAIN ID ID
+TABLE item Int ID
+""")
+    spec = wslh.parse_spec(schema, """\
+items: list for (i x) (item i x)
+    _idx_: value i
+    _val_: value x
+""")
+    rows = [(7, 'c'), (3, 'b'), (3, 'a'), (10, 'd')]
+    objects = wslh.rows2objects(schema, spec, { 'item': rows })
+    assert objects == { 'items': [x for i, x in sorted(rows)] }
+
+
+def test_exceptions():
+    text = 'first line\nsecond line\n'
+
+    e = wsl.ParseError('things', text, 2, 13, 'Bad thing')
+    assert str(e) == 'While parsing things (starting at line 1 char 3): At line 2 char 3: Bad thing'
+    assert e.args == (str(e),)
+    assert repr(e) == 'ParseError(%r)' %(str(e),)
+    e2 = pickle.loads(pickle.dumps(e))
+    assert type(e2) is wsl.ParseError
+    assert str(e2) == str(e)
+    assert (e2.context, e2.text, e2.startpos, e2.errorpos, e2.errormsg) == ('things', text, 2, 13, 'Bad thing')
+
+    e = wsl.LexError('token', text, 11, 14, 'Bad token')
+    assert str(e) == 'While lexing token (starting at line 2 char 1): At line 2 char 4: Bad token\nThe whole input: \n' + text + '\n'
+    assert e.args == (str(e),)
+    e2 = pickle.loads(pickle.dumps(e))
+    assert type(e2) is wsl.LexError
+    assert str(e2) == str(e)
+    assert (e2.lexicaltype, e2.text, e2.startpos, e2.errorpos, e2.errormsg) == ('token', text, 11, 14, 'Bad token')
+
+    # an option that is neither "?" nor "!"
+    badtext = mytext.replace('        :s ?\n', '        :s x\n')
+    try:
+        wslh.text2objects(myschema, myspec, badtext)
+    except wsl.ParseError as e:
+        assert 'At line 17 char 12: Expected "?", or "!" followed by value' in str(e), str(e)
+    else:
+        assert False, 'Invalid option was not detected'
+
+
+def test_orphan_rows():
+    schema = wsl.parse_schema("""
+DOMAIN Int Int
+TABLE A Int
+TABLE B Int Int
+""")
+    spec = wslh.parse_spec(schema, """\
+as: dict for (a) (A a)
+    _key_: value a
+    _val_: struct
+        a: value a
+        bs: set for (b) (B a b)
+            _val_: value b
+""")
+
+    objects = wslh.rows2objects(schema, spec, { 'A': [(1,)], 'B': [(1, 5)] })
+    assert objects == { 'as': { 1: { 'a': 1, 'bs': {5} } } }
+
+    # the row (2, 6) has no parent in A
+    try:
+        wslh.rows2objects(schema, spec, { 'A': [(1,)], 'B': [(1, 5), (2, 6)] })
+    except KeyError as e:
+        assert e.args == ((2,),)
+    else:
+        assert False, 'Row without parent was not detected'
+
+
+def test_member_order():
+    schema = wsl.parse_schema("""
+DOMAIN Int Int
+TABLE foo Int Int
+""")
+    spec = wslh.parse_spec(schema, """\
+foos: dict for (a b) (foo a b)
+    _key_: value a
+    _val_: struct
+        x_1: value a
+        y: value b
+""")
+
+    objects = { 'foos': { 1: { 'x_1': 1, 'y': 2 } } }
+    # members in spec order, and out of order
+    assert wslh.text2objects(schema, spec, ':foos\n    1\n        :x_1 1\n        :y 2\n') == objects
+    assert wslh.text2objects(schema, spec, ':foos\n    1\n        :y 2\n        :x_1 1\n') == objects
+
+
+def test_struct_none():
+    # a struct where an object is missing
+    objects = { 'bars': { 3: None } }
+    try:
+        wslh.objects2rows(myschema, myspec, objects)
+    except ValueError as e:
+        assert 'but got None' in str(e), str(e)
+    else:
+        assert False, 'None struct was not detected'
+
+
 if __name__ == '__main__':
     objects = test_rows2objects()
     tables = test_objects2rows()
@@ -190,4 +435,25 @@ if __name__ == '__main__':
     assert canonical_json(tables) == canonical_json(mytables)
     assert objects == objects2
     assert text == mytext
+    assert wslh.objects2bytes(myschema, myspec, myobject) == mytext.encode('utf-8')
+    assert wslh.bytes2objects(myschema, myspec, mytext.encode('utf-8')) == myobject
+
+    duptext = mytext.replace('        :d 666\n', '        :d 666\n        :d 666\n')
+    try:
+        wslh.text2objects(myschema, myspec, duptext)
+    except wsl.ParseError:
+        pass
+    else:
+        assert False, 'Duplicate struct member was not detected'
     # TODO: objects2json.py assert thejson == myjson
+
+    test_shadowed_variable()
+    test_json_factories()
+    test_reader_cache()
+    test_list_of_values()
+    test_db_trailing_comment()
+    test_list_indices()
+    test_exceptions()
+    test_orphan_rows()
+    test_member_order()
+    test_struct_none()
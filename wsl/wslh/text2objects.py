@@ -1,13 +1,29 @@
 import re
+import sys
 
 from ..exceptions import ParseError, LexError
 from ..schema import Schema
 from ..lexwsl import make_make_wslreader
 from .datatypes import Value, Struct, Option, Set, List, Dict
+from .parse import IDENTIFIER_REGEX
+from .readercache import ReaderCache
 
 
 INDENTSPACES = 4
 
+_SPACES_REGEX = re.compile(' *')
+
+
+_INDENTATIONS = {}
+
+
+def _indentation(indent):
+    """Get the string of *indent* spaces, shared among all readers"""
+    s = _INDENTATIONS.get(indent)
+    if s is None:
+        s = _INDENTATIONS.setdefault(indent, ' ' * indent)
+    return s
+
 
 def _chardesc(text, i):
     if i >= len(text):
@@ -22,27 +38,21 @@ def _chardesc(text, i):
 
 
 def parse_space(text, i):
-    start = i
-    end = len(text)
-    if i >= end or text[i] != ' ':
-        raise LexError('space character', text, i, i, 'Expected space character (0x20) but found %s' %(_chardesc(text, i),))
-    return i + 1
+    if text.startswith(' ', i):
+        return i + 1
+    raise LexError('space character', text, i, i, 'Expected space character (0x20) but found %s' %(_chardesc(text, i),))
 
 
 def parse_newline(text, i):
-    start = i
-    end = len(text)
-    if i >= end or text[i] != '\n':
-        raise LexError('newline character', text, i, i, 'Expected newline character (0x0a) but found %s' %(_chardesc(text, i),))
-    return i + 1
+    if text.startswith('\n', i):
+        return i + 1
+    raise LexError('newline character', text, i, i, 'Expected newline character (0x0a) but found %s' %(_chardesc(text, i),))
 
 
 def parse_colon(text, i):
-    start = i
-    end = len(text)
-    if i >= end or text[i] != ':':
-        raise LexError('colon character', text, i, i, 'Expected colon (":") character but found %s' %(_chardesc(text, i),))
-    return i + 1
+    if text.startswith(':', i):
+        return i + 1
+    raise LexError('colon character', text, i, i, 'Expected colon (":") character but found %s' %(_chardesc(text, i),))
 
 
 def parse_nothing(text, i):
@@ -50,48 +60,26 @@ def parse_nothing(text, i):
 
 
 def number_of_spaces(text, i):
-    start = i
-    end = len(text)
-    if i >= end:
+    # only used to report unexpected indentation. Readers match their
+    # indentation with a prefix test
+    if i >= len(text):
         return -1  # XXX
-    while i < end and text[i] == ' ':
-        i += 1
-    return i - start
+    return _SPACES_REGEX.match(text, i).end() - i
 
 
 def parse_keyword(text, i):
-    start = i
-    end = len(text)
-    while i < end and text[i].isalpha():
-        i += 1
-    if i == start:
+    m = IDENTIFIER_REGEX.match(text, i)
+    if m is None:
         raise LexError('Keyword', text, i, i, 'Found invalid character %s with no valid consumed characters' %(_chardesc(text, i),))
-    return i, text[start:i]
+    # keywords are interned, like the member keys of struct specs
+    return m.end(), sys.intern(m.group())
 
 
-def followed_by_newline(valuereader):
-    def parser(text, i):
-        i, v = valuereader(text, i)
-        i = parse_newline(text, i)
-        return i, v
-    return parser
-
-
-def space_and_then(valuereader):
-    def space_and_then_reader(text, i):
-        i = parse_space(text, i)
-        i, v = valuereader(text, i)
-        i = parse_newline(text, i)
-        return i, v
-    return space_and_then_reader
-
-
-def newline_and_then(valuereader):
-    def newline_and_then_reader(text, i):
-        i = parse_newline(text, i)
-        i, v = valuereader(text, i)
-        return i, v
-    return newline_and_then_reader
+# readers for the whitespace before and after a struct member, by member type
+_MEMBER_DELIMITERS = {
+    Value: (parse_space, parse_newline),
+    Option: (parse_space, parse_nothing),
+}
 
 
 def value2objects(make_reader, spec, indent):
@@ -104,57 +92,86 @@ def value2objects(make_reader, spec, indent):
 def struct2objects(make_reader, spec, indent):
     dct = {}
     for k, v in spec.childs.items():
+        # parsed structs use the interned spec key objects as their keys
+        k = sys.intern(k)
         val_reader = any2objects(make_reader, v, indent + INDENTSPACES)
-        if type(v) == Value:
-            ws_reader = parse_space
-            end_reader = parse_newline
-        elif type(v) == Option:
-            ws_reader = parse_space
-            end_reader = parse_nothing
-        else:
-            ws_reader = parse_newline
-            end_reader = parse_nothing
-        dct[k] = (ws_reader, val_reader, end_reader)
+        ws_reader, end_reader = _MEMBER_DELIMITERS.get(type(v), (parse_newline, parse_nothing))
+        dct[k] = (ws_reader, val_reader, end_reader is parse_newline)
+
+    # Members are usually written in sorted order. For each member, the
+    # member that is expected next is recognized with a single prefix match
+    # that covers the colon, the key and the following whitespace.
+    expected = []
+    for k, (ws_reader, val_reader, newline_after) in sorted(dct.items()):
+        sep = ' ' if ws_reader is parse_space else '\n'
+        expected.append((':' + k + sep, k, val_reader, newline_after))
+    expected.append((None, None, None, None))
+    position = { k: n for n, (_, k, _, _) in enumerate(expected) }
+
+    get_parsers = dct.get
+    indentstr = _indentation(indent)
+
+    # Members that come in sorted order are read in a straight run first,
+    # each line recognized by one prefix match that includes the indentation.
+    inorder = [(indentstr + prefix, len(indentstr + prefix), key, val_reader, newline_after)
+               for prefix, key, val_reader, newline_after in expected[:-1]]
 
     def struct_reader(text, i):
         start = i
         end = len(text)
 
-        items = []
+        struct = {}
+        nxt = 0
 
+        for prefix, n, key, parse_val, newline_after in inorder:
+            if not text.startswith(prefix, i):
+                break
+            i, val = parse_val(text, i + n)
+            if newline_after:
+                if not text.startswith('\n', i):
+                    parse_newline(text, i)
+                i += 1
+            struct[key] = val
+            nxt += 1
+
+        # Members out of order, and all errors, are handled member by member
         while True:
-            nsp = number_of_spaces(text, i)
-            if nsp < indent:
+            if i >= end or not text.startswith(indentstr, i):
                 break
-            if nsp > indent:
-                raise ParseError('struct at indent level %d' %(indent,), text, start, i, 'unexpected indent of %d' %(nsp,))
+            if text.startswith(' ', i + indent):
+                raise ParseError('struct at indent level %d' %(indent,), text, start, i, 'unexpected indent of %d' %(number_of_spaces(text, i),))
 
-            i += nsp
-            i = parse_colon(text, i)
+            i += indent
 
-            i, key = parse_keyword(text, i)
-            parsers = dct.get(key)
-            if parsers is None:
-                raise ParseError('struct', text, start, i, 'Invalid member "%s". Valid members are %s'% (key, list(dct)))
-            parse_ws, parse_val, parse_end = parsers
+            prefix, key, parse_val, newline_after = expected[nxt]
+            if prefix is not None and text.startswith(prefix, i):
+                i += len(prefix)
+            else:
+                i = parse_colon(text, i)
 
-            i = parse_ws(text, i)
-            i, val = parse_val(text, i)
-            i = parse_end(text, i)
+                i, key = parse_keyword(text, i)
+                parsers = get_parsers(key)
+                if parsers is None:
+                    raise ParseError('struct', text, start, i, 'Invalid member "%s". Valid members are %s'% (key, list(dct)))
+                parse_ws, parse_val, newline_after = parsers
 
-            items.append((key, val))
+                i = parse_ws(text, i)
 
-        struct = {}
+            nxt = position[key] + 1
+            i, val = parse_val(text, i)
+            if newline_after:
+                if not text.startswith('\n', i):
+                    parse_newline(text, i)
+                i += 1
 
-        for k, v in items:
-            if k not in dct.keys():
-                raise ParseError('struct', text, start, i, 'Invalid key: %s' %(k,))
-            if k in items:
-                raise ParseError('struct', text, start, i, 'Duplicate key: %s' %(k,))
-            struct[k] = v
-        for k in dct.keys():
-            if k not in struct:
-                raise ParseError('struct', text, start, i, 'Missing key: %s' %(k,))
+            if key in struct:
+                raise ParseError('struct', text, start, i, 'Duplicate key: %s' %(key,))
+            struct[key] = val
+
+        if len(struct) != len(dct):
+            for k in dct:
+                if k not in struct:
+                    raise ParseError('struct', text, start, i, 'Missing key: %s' %(k,))
 
         return i, struct
     return struct_reader
@@ -163,22 +180,28 @@ def struct2objects(make_reader, spec, indent):
 def option2objects(make_reader, spec, indent):
     val_reader = any2objects(make_reader, spec.childs['_val_'], indent)
 
+    # A plain value follows on the same line, anything else on the next
     if type(spec.childs['_val_']) == Value:
-        val_reader = space_and_then(val_reader)
+        sep, parse_sep, newline_after = ' ', parse_space, True
     else:
-        val_reader = newline_and_then(val_reader)
+        sep, parse_sep, newline_after = '\n', parse_newline, False
+    present = '!' + sep
 
     def option_reader(text, i):
-        end = len(text)
-        if i < end and text[i] == '!':
-            i += 1
-            i, val = val_reader(text, i)
-        elif i < end and text[i] == '?':
-            i, val = i+1, None
-            i = parse_newline(text, i)
-        else:
-            raise ParseError('Expected option ("?", or "!" followed by value)', text, i)
-        return i, val
+        if text.startswith('?\n', i):
+            return i + 2, None
+        if text.startswith(present, i):
+            i, val = val_reader(text, i + 2)
+            if newline_after:
+                if not text.startswith('\n', i):
+                    parse_newline(text, i)
+                i += 1
+            return i, val
+        if text.startswith('!', i):
+            parse_sep(text, i + 1)
+        if text.startswith('?', i):
+            parse_newline(text, i + 1)
+        raise ParseError('option', text, i, i, 'Expected "?", or "!" followed by value, but found %s' %(_chardesc(text, i),))
 
     return option_reader
 
@@ -186,25 +209,27 @@ def option2objects(make_reader, spec, indent):
 def set2objects(make_reader, spec, indent):
     val_reader = any2objects(make_reader, spec.childs['_val_'], indent)
 
-    if type(spec.childs['_val_']) == Value:
-        end_reader = parse_newline
-    else:
-        end_reader = parse_nothing
+    newline_after = type(spec.childs['_val_']) == Value
+
+    indentstr = _indentation(indent)
 
     def set_reader(text, i):
         start = i
         end = len(text)
         set_ = set()
+        add = set_.add
         while True:
-            nsp = number_of_spaces(text, i)
-            if nsp < indent:
+            if i >= end or not text.startswith(indentstr, i):
                 break
-            if nsp > indent:
-                raise ParseError('set at indent level %d' %(indent,), text, start, i, 'unexpected indent of %d' %(nsp,))
-            i += nsp
+            if text.startswith(' ', i + indent):
+                raise ParseError('set at indent level %d' %(indent,), text, start, i, 'unexpected indent of %d' %(number_of_spaces(text, i),))
+            i += indent
             i, val = val_reader(text, i)
-            i = end_reader(text, i)
-            set_.add(val)
+            if newline_after:
+                if not text.startswith('\n', i):
+                    parse_newline(text, i)
+                i += 1
+            add(val)
         return i, set_
 
     return set_reader
@@ -213,28 +238,62 @@ def set2objects(make_reader, spec, indent):
 def list2objects(make_reader, spec, indent):
     val_reader = any2objects(make_reader, spec.childs['_val_'], indent)
 
-    if type(spec.childs['_val_']) == Value:
-        end_reader = parse_newline
-    else:
-        end_reader = parse_nothing
+    newline_after = type(spec.childs['_val_']) == Value
+
+    indentstr = _indentation(indent)
 
     def list_reader(text, i):
         start = i
         end = len(text)
-        set_ = set()
+        lst = []
+        append = lst.append
         while True:
-            nsp = number_of_spaces(text, i)
-            if nsp < indent:
+            if i >= end or not text.startswith(indentstr, i):
                 break
-            if nsp > indent:
-                raise ParseError('list at indent level %d' %(indent,), text, start, i, 'unexpected indent of %d' %(nsp,))
-            i += nsp
+            if text.startswith(' ', i + indent):
+                raise ParseError('list at indent level %d' %(indent,), text, start, i, 'unexpected indent of %d' %(number_of_spaces(text, i),))
+            i += indent
             i, val = val_reader(text, i)
-            i = end_reader(text, i)
-            set_.add(val)
-        return i, set_
-
-    return list_reader
+            if newline_after:
+                if not text.startswith('\n', i):
+                    parse_newline(text, i)
+                i += 1
+            append(val)
+        return i, lst
+
+    # At indent 0 every line would match, so the block can't be delimited
+    if not newline_after or indent == 0:
+        return list_reader
+
+    # A list of plain values is a block of lines with one value each. The
+    # lines of the block are found with a single regex match, split apart in
+    # one go, and the values are read line by line. If any line doesn't hold
+    # exactly one value, the block is read again with list_reader, which
+    # reports the error at the right position.
+    block_regex = re.compile('(?:%s[^ \n][^\n]*\n)*' %(indentstr,))
+
+    def list_of_values_reader(text, i):
+        j = block_regex.match(text, i).end()
+        if text.startswith(indentstr, j):
+            return list_reader(text, i)
+        lines = text[i:j].split('\n')
+        lines.pop()
+        lst = []
+        append = lst.append
+        try:
+            for line in lines:
+                k, val = val_reader(line, indent)
+                if k != len(line):
+                    return list_reader(text, i)
+                append(val)
+        except ValueError:
+            # Lex and parse errors are ValueErrors, like the errors of
+            # domain decoders. They are raised again by list_reader, with
+            # positions relative to the whole text.
+            return list_reader(text, i)
+        return j, lst
+
+    return list_of_values_reader
 
 
 def dict2objects(make_reader, spec, indent):
@@ -242,27 +301,30 @@ def dict2objects(make_reader, spec, indent):
     val_reader = any2objects(make_reader, spec.childs['_val_'], indent + INDENTSPACES)
 
     if type(spec.childs['_val_']) in [Value, Option]:
-        ws_reader = parse_space
-        end_reader = parse_newline
+        sep, parse_sep, newline_after = ' ', parse_space, True
     else:
-        ws_reader = parse_newline
-        end_reader = parse_nothing
+        sep, parse_sep, newline_after = '\n', parse_newline, False
+
+    indentstr = _indentation(indent)
 
     def dict_reader(text, i):
         start = i
         end = len(text)
         dct = {}
         while True:
-            nsp = number_of_spaces(text, i)
-            if nsp < indent:
+            if i >= end or not text.startswith(indentstr, i):
                 break
-            if nsp > indent:
-                raise ParseError('dict at indent level %d' %(indent,), text, start, i, 'unexpected indent of %d' %(nsp,))
-            i += nsp
+            if text.startswith(' ', i + indent):
+                raise ParseError('dict at indent level %d' %(indent,), text, start, i, 'unexpected indent of %d' %(number_of_spaces(text, i),))
+            i += indent
             i, key = key_reader(text, i)
-            i = ws_reader(text, i)
-            i, val = val_reader(text, i)
-            i = end_reader(text, i)
+            if not text.startswith(sep, i):
+                parse_sep(text, i)
+            i, val = val_reader(text, i + 1)
+            if newline_after:
+                if not text.startswith('\n', i):
+                    parse_newline(text, i)
+                i += 1
             if dct.setdefault(key, val) is not val:
                 raise ParseError('dict', text, start, i, 'Duplicate key "%s"' %(key,))
         return i, dct
@@ -270,44 +332,58 @@ def dict2objects(make_reader, spec, indent):
     return dict_reader
 
 
-def any2objects(make_reader, spec, indent):
-    typ = type(spec)
-
-    if typ == Value:
-        return value2objects(make_reader, spec, indent)
-
-    elif typ == Struct:
-        return struct2objects(make_reader, spec, indent)
-
-    elif typ == Option:
-        return option2objects(make_reader, spec, indent)
+_DISPATCH = {
+    Value: value2objects,
+    Struct: struct2objects,
+    Option: option2objects,
+    Set: set2objects,
+    List: list2objects,
+    Dict: dict2objects,
+}
 
-    elif typ == Set:
-        return set2objects(make_reader, spec, indent)
 
-    elif typ == List:
-        return list2objects(make_reader, spec, indent)
-
-    elif typ == Dict:
-        return dict2objects(make_reader, spec, indent)
-
-    else:
+def any2objects(make_reader, spec, indent):
+    conv = _DISPATCH.get(type(spec))
+    if conv is None:
         raise TypeError()  # or missing case?
 
+    return conv(make_reader, spec, indent)
+
 
 def run_reader(reader, text):
     i, r = reader(text, 0)
     if i != len(text):
-        raise ParseError('Unconsumed text', text, i)
+        raise ParseError('WSLH text', text, 0, i, 'Unconsumed text')
     return r
 
 
+def compile_reader(spec, schema):
+    return any2objects(make_make_wslreader(schema), spec, 0)
+
+
+_READERS = ReaderCache(compile_reader)
+
+
 def text2objects(schema, spec, text):
     if not isinstance(schema, Schema):
         raise TypeError()
     if not isinstance(text, str):
         raise TypeError()
 
-    reader = any2objects(make_make_wslreader(schema), spec, 0)
+    reader = _READERS.get(spec, schema)
 
     return run_reader(reader, text)
+
+
+def bytes2objects(schema, spec, data, encoding='utf-8'):
+    """Like *text2objects*, but parse text that is encoded as *bytes*.
+
+    This is a convenience for callers that read from binary files or
+    sockets. The input is decoded as a whole and then parsed as *str*, so it
+    is no faster than calling *text2objects* on the decoded text. Positions
+    in error messages refer to the decoded text.
+    """
+    if not isinstance(data, bytes):
+        raise TypeError()
+
+    return text2objects(schema, spec, data.decode(encoding))